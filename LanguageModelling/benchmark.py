@@ -0,0 +1,201 @@
+# Benchmarks of the training and scoring stages, to tell whether a change helps or hurts.
+# The stages of every corpus run in their own process, so that their peak RSS is their own:
+#   tokenize  : tokenizeFile over the whole file
+#   count     : NgramModel.countLines (vocabulary and n-gram dictionaries)
+#   build     : countArrays and NgramModel.build (trie layout and Kneser-Ney smoothing)
+#   save      : saveBinary, giving the model size
+#   score     : NgramModel.corpusPerplexity over the first SCORE_LINES lines
+#   lan_model_1 : the whole lan_model_1.py script (counting and the three perplexities), with the
+#                 summary of its own stages (instrumentation.py). It is started from this small driver
+#                 process, not from the one that ran the other stages: on Linux a child starts from the
+#                 peak RSS of the process it was forked from, which would hide its own.
+# and every stage reports its time and throughput in tokens per second.
+#
+# Larger corpora are made by scaleCorpus: the lines are written factor times, each copy shuffled and
+# with some of its words given a copy suffix, so the vocabulary keeps growing as with real data.
+# -save writes the results as a baseline JSON file, -baseline compares them with one and reports the
+# stages whose throughput dropped by more than TOLERANCE, the peak RSS (of the stages process and of
+# lan_model_1.py) that grew by more than RSS_TOLERANCE and the model sizes that grew by more than
+# SIZE_TOLERANCE (the exit status is then 1).
+#
+# Usage: python benchmark.py [-scales 1,10,100,1000] [-baseline baseline.json] [-save baseline.json] [files...]
+# (default files: codemix_data/train_3.txt and ../Perplexity_CMI/codemix_train.txt, default scales: 1,10)
+
+# Code
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import subprocess
+from tokenizer import tokenizeFile
+from ngram_model import NgramModel, countArrays
+from model_io import saveBinary
+from instrumentation import peakRss
+
+HERE=os.path.dirname(os.path.abspath(__file__))
+FILES=[os.path.join(HERE, 'codemix_data', 'train_3.txt'), os.path.join(HERE, '..', 'Perplexity_CMI', 'codemix_train.txt')]
+SCORE_LINES=20000	# Lines scored by the score stage, per-line scoring being much slower than counting
+TOLERANCE=0.1		# Throughput drop reported as a regression
+RSS_TOLERANCE=0.1	# Peak RSS growth reported as a regression
+SIZE_TOLERANCE=0.02	# Model size growth reported as a regression
+RENAME=0.1		# Probability that a word of a copy gets the copy suffix
+
+# Write the lines of filename factor times to output, every copy after the first one shuffled and perturbed.
+def scaleCorpus(filename, factor, output, seed=0):
+	with open(filename) as f:
+		lines = [line.rstrip('\n') for line in f]
+	rand = random.Random(seed)
+	with open(output, 'w') as f:
+		for copy in range(factor):
+			order = list(range(len(lines)))
+			if copy>0:
+				rand.shuffle(order)
+			for i in order:
+				words = lines[i].split(' ')
+				if copy>0:
+					words = [word+'_%d' % copy if word and rand.random()<RENAME else word for word in words]
+				f.write(' '.join(words)+'\n')
+	return output
+
+# Run function as a stage, recording its time and throughput over tokens.
+def timeStage(stages, name, tokens, function):
+	start = time.time()
+	result = function()
+	seconds = time.time()-start
+	stages[name] = {'seconds': seconds, 'tokensPerSecond': tokens/seconds if seconds>0 else None}
+	return result
+
+# The stages on one file, in this process.
+def runStages(filename):
+	stages = {}
+	start = time.time()
+	lines = tokenizeFile(filename)
+	tokens = sum(len(line) for line in lines)
+	seconds = time.time()-start
+	stages['tokenize'] = {'seconds': seconds, 'tokensPerSecond': tokens/seconds if seconds>0 else None}
+	with open(filename) as f:
+		text = f.readlines()
+	model = NgramModel(3)
+	tables = timeStage(stages, 'count', tokens, lambda: model.countLines(text))
+	timeStage(stages, 'build', tokens, lambda: model.build(*countArrays(tables)))
+	handle, modelFile = tempfile.mkstemp(suffix='.bin')
+	os.close(handle)
+	try:
+		timeStage(stages, 'save', tokens, lambda: saveBinary(model, modelFile))
+		modelBytes = os.path.getsize(modelFile)
+	finally:
+		os.remove(modelFile)
+	sample = text[:SCORE_LINES]
+	sampleTokens = sum(len(line) for line in lines[:SCORE_LINES])
+	timeStage(stages, 'score', sampleTokens, lambda: model.corpusPerplexity(sample))
+	return {'lines': len(lines), 'tokens': tokens, 'vocabulary': len(model.vocab), 'modelBytes': modelBytes,
+		'peakRssKB': peakRss(), 'stages': stages}
+
+# Run lan_model_1.py on a file, returning its stage of the results. The peak RSS is that of this child
+# alone (os.wait4), and its output goes to temporary files so that waiting cannot block on a full pipe.
+def runLanModel(filename, tokens):
+	output = tempfile.TemporaryFile()
+	errors = tempfile.TemporaryFile()
+	try:
+		start = time.time()
+		process = subprocess.Popen([sys.executable, os.path.join(HERE, 'lan_model_1.py'), filename], stdout=output, stderr=errors)
+		pid, status, usage = os.wait4(process.pid, 0)
+		process.returncode = status
+		seconds = time.time()-start
+		errors.seek(0)
+		summary = errors.read().decode('utf-8')
+	finally:
+		output.close()
+		errors.close()
+	if status!=0:
+		raise RuntimeError("lan_model_1.py failed on "+filename+":\n"+summary)
+	# lan_model_1.py ends with the JSON summary of its own stages on stderr.
+	return {'seconds': seconds, 'tokensPerSecond': tokens/seconds, 'peakRssKB': usage.ru_maxrss,
+		'summary': json.loads(summary.strip().split('\n')[-1])}
+
+# runStages in a new process, then lan_model_1.py in another one.
+def benchmark(filename):
+	output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '-run', filename])
+	result = json.loads(output.decode('utf-8'))
+	result['stages']['lan_model_1'] = runLanModel(filename, result['tokens'])
+	return result
+
+def runAll(files, scales):
+	results = {}
+	tempDir = tempfile.mkdtemp()
+	try:
+		for filename in files:
+			name = os.path.splitext(os.path.basename(filename))[0]
+			for factor in scales:
+				path = filename
+				if factor>1:
+					path = scaleCorpus(filename, factor, os.path.join(tempDir, '%s_x%d.txt' % (name, factor)))
+				results['%s_x%d' % (name, factor)] = benchmark(path)
+				if path!=filename:
+					os.remove(path)
+	finally:
+		shutil.rmtree(tempDir, ignore_errors=True)
+	return results
+
+# Regressions against the baseline, as (run, message): stages whose throughput is more than TOLERANCE
+# below it, peak RSS more than RSS_TOLERANCE above it and model sizes more than SIZE_TOLERANCE above it.
+def compare(results, baseline):
+	regressions = []
+	for run in sorted(results):
+		if run not in baseline:
+			continue
+		result, before = results[run], baseline[run]
+		for stage in sorted(result['stages']):
+			old = before['stages'].get(stage, {}).get('tokensPerSecond')
+			new = result['stages'][stage]['tokensPerSecond']
+			if old and new and new/old<1-TOLERANCE:
+				regressions.append((run, "%s at %.0f%% of the baseline throughput" % (stage, 100*new/old)))
+		grown = [("peak RSS", before.get('peakRssKB'), result['peakRssKB'], RSS_TOLERANCE),
+			("lan_model_1 peak RSS", before['stages'].get('lan_model_1', {}).get('peakRssKB'),
+				result['stages']['lan_model_1']['peakRssKB'], RSS_TOLERANCE),
+			("model size", before.get('modelBytes'), result['modelBytes'], SIZE_TOLERANCE)]
+		for what, old, new, tolerance in grown:
+			if old and new and float(new)/old>1+tolerance:
+				regressions.append((run, "%s at %.0f%% of the baseline (%d, was %d)" % (what, 100.0*new/old, new, old)))
+	return regressions
+
+def printResults(results):
+	print("%-28s%-13s%12s%16s" % ("Run", "Stage", "Seconds", "Tokens/s"))
+	for run in sorted(results):
+		result = results[run]
+		for stage in ['tokenize', 'count', 'build', 'save', 'score', 'lan_model_1']:
+			s = result['stages'][stage]
+			print("%-28s%-13s%12.3f%16.0f" % (run, stage, s['seconds'], s['tokensPerSecond'] or 0))
+		print("%-28s%d tokens, model %.1f MB, peak RSS %.1f MB (lan_model_1.py %.1f MB)" % (run, result['tokens'],
+			result['modelBytes']/1048576.0, result['peakRssKB']/1024.0, result['stages']['lan_model_1']['peakRssKB']/1024.0))
+
+if __name__=='__main__':
+	args = sys.argv[1:]
+	if args[:1]==['-run']:
+		print(json.dumps(runStages(args[1])))
+		sys.exit(0)
+	options = {}
+	for option in ['-scales', '-baseline', '-save']:
+		if option in args:
+			i = args.index(option)
+			options[option] = args[i+1]
+			del args[i:i+2]
+	scales = [int(s) for s in options.get('-scales', '1,10').split(',')]
+	results = runAll(args or FILES, scales)
+	printResults(results)
+	if '-save' in options:
+		with open(options['-save'], 'w') as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+	if '-baseline' in options:
+		with open(options['-baseline']) as f:
+			regressions = compare(results, json.load(f))
+		for run, message in regressions:
+			print("Regression: %s %s" % (run, message))
+		if regressions:
+			sys.exit(1)
+		print("No stage more than %d%% slower, peak RSS more than %d%% or model more than %d%% larger than the baseline" % (
+			100*TOLERANCE, 100*RSS_TOLERANCE, 100*SIZE_TOLERANCE))
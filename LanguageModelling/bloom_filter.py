@@ -0,0 +1,97 @@
+# Bloom filter in front of an n-gram table, so that the many lookups of n-grams that were never seen
+# (most top-order lookups of a backoff model on new tweets) are answered without searching the table.
+# For n keys and a target false positive rate p it has m = -n ln(p)/ln(2)^2 bits and k = m/n ln(2)
+# probes per key, taken by double hashing from one 64 bit hash: (h1 + i*h2) % m for i < k.
+# The same filter is queried one key at a time (contains, for NgramModel.find) or for a whole array of
+# keys at once with NumPy (containsAll, for the vectorized scoring of lan_model_1.py).
+#
+# Counters: queries, rejected (answered "not seen" by the filter alone), and among the keys that
+# passed, hits (found in the table) and falsePositives (not found), reported by the caller with
+# confirm/confirmAll. stats() gives them with the measured false positive rate.
+
+# Code
+import math
+import numpy as np
+from hashing import mix, mixInt, MASK
+
+SEED=0x2545f4914f6cdd1d
+
+# One 64 bit key for every row of an array of n-grams (word ids), and for one n-gram (a list of ids).
+def gramKeys(grams):
+	keys = np.full(len(grams), SEED, dtype=np.uint64)
+	with np.errstate(over='ignore'):
+		for j in range(grams.shape[1]):
+			keys = mix(keys^grams[:, j].astype(np.uint64))
+	return keys
+
+def gramKey(ids):
+	key = SEED
+	for word in ids:
+		key = mixInt(key^word)
+	return key
+
+class BloomFilter(object):
+
+	def __init__(self, n, falsePositiveRate=0.01):
+		n = max(1, n)
+		self.m = max(8, int(math.ceil(-n*math.log(falsePositiveRate)/math.log(2)**2)))
+		self.k = max(1, int(round(self.m/float(n)*math.log(2))))
+		self.bits = bytearray((self.m+7)//8)
+		self.queries = 0
+		self.rejected = 0
+		self.hits = 0
+		self.falsePositives = 0
+
+	# Bit positions of every key, shape (k, number of keys).
+	def positions(self, keys):
+		with np.errstate(over='ignore'):
+			h = mix(np.asarray(keys).astype(np.uint64)^np.uint64(SEED))
+			h1 = h&np.uint64(0xffffffff)
+			h2 = (h>>np.uint64(32))|np.uint64(1)
+			return np.array([(h1+np.uint64(i)*h2)%np.uint64(self.m) for i in range(self.k)]).astype(np.int64)
+
+	def add(self, keys):
+		positions = self.positions(keys).ravel()
+		array = np.frombuffer(self.bits, dtype=np.uint8)
+		np.bitwise_or.at(array, positions>>3, (1<<(positions&7)).astype(np.uint8))
+
+	def containsAll(self, keys):
+		positions = self.positions(keys)
+		array = np.frombuffer(self.bits, dtype=np.uint8)
+		passed = ((array[positions>>3]>>(positions&7))&1).all(axis=0)
+		self.queries += len(passed)
+		self.rejected += len(passed)-int(np.count_nonzero(passed))
+		return passed
+
+	def contains(self, key):
+		self.queries+=1
+		h = mixInt((key^SEED)&MASK)
+		h1 = h&0xffffffff
+		h2 = (h>>32)|1
+		bits = self.bits
+		for i in range(self.k):
+			position = (h1+i*h2)%self.m
+			if not (bits[position>>3]>>(position&7))&1:
+				self.rejected+=1
+				return False
+		return True
+
+	def containsGram(self, ids):
+		return self.contains(gramKey(ids))
+
+	# Whether the table had a key that passed the filter.
+	def confirm(self, found):
+		if found:
+			self.hits+=1
+		else:
+			self.falsePositives+=1
+
+	def confirmAll(self, found):
+		hits = int(np.count_nonzero(found))
+		self.hits += hits
+		self.falsePositives += len(found)-hits
+
+	def stats(self):
+		negatives = self.rejected+self.falsePositives
+		return {'bits': self.m, 'probes': self.k, 'queries': self.queries, 'rejected': self.rejected, 'hits': self.hits,
+			'falsePositives': self.falsePositives, 'falsePositiveRate': self.falsePositives/float(negatives) if negatives else 0.0}
@@ -19,11 +19,11 @@
 
 # Code
 import numpy as np
-import nltk
 import os
 import sys
 # from nltk.stem import PorterStemmer
-from nltk.tokenize import sent_tokenize, word_tokenize, wordpunct_tokenize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tokenizer import wordpunct_tokenize
 import json
 import re
 # porter = PorterStemmer()
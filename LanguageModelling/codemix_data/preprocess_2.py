@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*- 
 import re
 import preprocessor as p
-from nltk.tokenize import sent_tokenize, word_tokenize, wordpunct_tokenize
 from nltk.stem import PorterStemmer
 porter = PorterStemmer()
 f = open("train_2.txt","w")
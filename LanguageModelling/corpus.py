@@ -0,0 +1,85 @@
+# Compiled corpus: a text file tokenized once (tokenizer.py) and stored as arrays, so that
+# training and scoring read word ids from memory-mapped files instead of tokenizing the text again.
+# A compiled corpus is a folder holding:
+#   ids.npy     : uint32 word id of every token, the lines one after the other
+#   offsets.npy : int64, the tokens of line i are ids[offsets[i]:offsets[i+1]] (empty lines included)
+#   vocab.txt   : the word of every id, one per line
+# Ids follow NgramModel: 0 is <s>, 1 is <unk> (neither appears in ids), then the words in order of
+# first appearance, so an open-vocabulary NgramModel fitted on the corpus gives its words the same ids.
+#
+# lan_model_1.py, NgramModel.fitCorpus/compiledPerplexity, the training of model_io.py, parallel_count.py,
+# external_count.py and sketch_model.py, and Perplexity_CMI/2_4_perplexity.py take a compiled corpus
+# folder wherever they take a text file.
+#
+# Usage: python corpus.py text.txt [folder]	(folder defaults to text.corpus)
+
+# Code
+import os
+import sys
+import numpy as np
+from array import array
+from tokenizer import tokenizeFile
+from ngram_model import START, UNK
+
+# Tokenize a text file once and write it as a compiled corpus in folder.
+def compileCorpus(filename, folder=None):
+	folder = folder or os.path.splitext(filename)[0]+'.corpus'
+	wordIds = {START: 0, UNK: 1}
+	vocab = [START, UNK]
+	ids = array('l')
+	offsets = array('l', [0])
+	for listOfWords in tokenizeFile(filename):
+		for word in listOfWords:
+			if word not in wordIds:
+				wordIds[word] = len(vocab)
+				vocab.append(word)
+			ids.append(wordIds[word])
+		offsets.append(len(ids))
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	np.save(os.path.join(folder, 'ids.npy'), np.array(ids, dtype=np.uint32))
+	np.save(os.path.join(folder, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+	text = '\n'.join(vocab)
+	if not isinstance(text, bytes):
+		text = text.encode('utf-8')
+	with open(os.path.join(folder, 'vocab.txt'), 'wb') as f:
+		f.write(text)
+	return folder
+
+def isCompiled(path):
+	return os.path.isdir(path) and os.path.exists(os.path.join(path, 'ids.npy'))
+
+class Corpus(object):
+
+	def __init__(self, folder):
+		self.ids = np.load(os.path.join(folder, 'ids.npy'), mmap_mode='r')
+		self.offsets = np.load(os.path.join(folder, 'offsets.npy'), mmap_mode='r')
+		with open(os.path.join(folder, 'vocab.txt'), 'rb') as f:
+			text = f.read()
+		if not isinstance(text, str):
+			text = text.decode('utf-8')
+		self.vocab = text.split('\n')
+
+	def __len__(self):
+		return len(self.offsets)-1
+
+	def lineIds(self, i):
+		return self.ids[self.offsets[i]:self.offsets[i+1]]
+
+	# Token lists of every line, as wordpunct_tokenize gives them for the text.
+	def lines(self):
+		vocab = self.vocab
+		for i in range(len(self)):
+			yield [vocab[j] for j in self.lineIds(i)]
+
+	# Frequency of every word (wordFrequencies of the text) from one bincount over the ids.
+	def frequencies(self):
+		counts = np.bincount(self.ids, minlength=len(self.vocab))
+		return dict((self.vocab[i], int(counts[i])) for i in np.flatnonzero(counts))
+
+	# Array giving the id in wordIds of every corpus id, UNK's id (1) for the words wordIds does not have.
+	def idMap(self, wordIds):
+		return np.array([wordIds.get(word, 1) for word in self.vocab], dtype=np.int64)
+
+if __name__=='__main__':
+	print("Compiled into "+compileCorpus(sys.argv[1], sys.argv[2] if len(sys.argv)>2 else None))
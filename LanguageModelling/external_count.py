@@ -0,0 +1,160 @@
+# Count the n-grams of a file that is too big for the count dictionaries to fit in memory,
+# the way text2idngram of the CMU toolkit does.
+# Lines are counted into dictionaries until they hold about memoryBudget bytes. The counts are then
+# spilled to a temporary file as a sorted run per order: the n-grams packed as fixed width keys
+# (big-endian 32 bit word ids, so byte order is id order) and their counts. When the file is read,
+# the runs of every order are k-way merged with heapq.merge, reading each run in blocks, and the
+# counts of equal keys are added up. The merged rows go to memory-mapped arrays in blocks, so only the
+# vocabulary and the final n-gram arrays are kept whole in memory.
+#
+# A compiled corpus (corpus.py) is counted from its ids, BATCH lines at a time, in the same way.
+#
+# Usage: python external_count.py train.txt|train.corpus model.bin [order] [memory budget in MB]
+
+# Code
+import os
+import sys
+import heapq
+import shutil
+import tempfile
+import numpy as np
+from ngram_model import NgramModel
+from corpus import Corpus, isCompiled
+
+ENTRY_BYTES=200		# Rough memory used by one n-gram in a count dictionary (tuple key, count, slot)
+BATCH=1000		# Lines counted between two checks of the budget
+BLOCK=65536		# Rows read at once from a run while merging
+
+# Fixed width keys of an array of n-grams.
+def packKeys(grams):
+	width = 4*grams.shape[1]
+	return np.ascontiguousarray(grams.astype('>u4')).view('S%d' % width).ravel()
+
+# N-gram array of a list of keys ("S" arrays drop trailing zero bytes, so they are padded back).
+def unpackKeys(keys, k):
+	width = 4*(k+1)
+	data = b''.join([key.ljust(width, b'\0') for key in keys])
+	return np.frombuffer(data, dtype='>u4').reshape(len(keys), k+1).astype(np.int64)
+
+class ExternalCounter(object):
+
+	def __init__(self, model, memoryBudget=256*1024*1024, tempDir=None):
+		self.model = model
+		self.maxEntries = max(1, memoryBudget//ENTRY_BYTES)
+		self.tempDir = tempfile.mkdtemp(dir=tempDir)
+		self.runs = 0
+		self.tables = None
+
+	def entries(self):
+		return sum(len(table) for table in self.tables)
+
+	# Write the current counts as one sorted run per order and start again from empty dictionaries.
+	def spill(self):
+		for k in range(self.model.order):
+			table = self.tables[k]
+			grams = np.array(list(table.keys()), dtype=np.int64).reshape(len(table), k+1)
+			keys = packKeys(grams)
+			counts = np.array(list(table.values()), dtype=np.int64)
+			order = np.argsort(keys, kind='mergesort')
+			np.save(self.runFile(self.runs, k, 'keys'), keys[order])
+			np.save(self.runFile(self.runs, k, 'counts'), counts[order])
+		self.runs+=1
+		self.tables = None
+
+	def runFile(self, run, k, name):
+		return os.path.join(self.tempDir, 'run%s_%d_%s.npy' % (run, k, name))
+
+	def countLines(self, lines):
+		batch = []
+		for line in lines:
+			batch.append(line)
+			if len(batch)==BATCH:
+				self.countBatch(batch)
+				batch = []
+		if batch:
+			self.countBatch(batch)
+		if self.tables is not None:
+			self.spill()
+
+	def countBatch(self, batch):
+		self.tables = self.model.countLines(batch, self.tables)
+		if self.entries()>=self.maxEntries:
+			self.spill()
+
+	# countLines for a compiled corpus.
+	def countCorpus(self, corpus):
+		mapping = self.model.corpusIds(corpus)
+		for start in range(0, len(corpus), BATCH):
+			self.tables = self.model.countCorpus(corpus, self.tables, start, min(start+BATCH, len(corpus)), mapping)
+			if self.entries()>=self.maxEntries:
+				self.spill()
+		if self.tables is not None:
+			self.spill()
+
+	# (key, count) pairs of one run, in order, read block rows at a time.
+	def readRun(self, run, k, block=BLOCK):
+		keys = np.load(self.runFile(run, k, 'keys'), mmap_mode='r')
+		counts = np.load(self.runFile(run, k, 'counts'), mmap_mode='r')
+		for start in range(0, len(keys), block):
+			for pair in zip(keys[start:start+block].tolist(), counts[start:start+block].tolist()):
+				yield pair
+
+	# Merge the runs of every order into sorted n-gram and count arrays. Every run is read, and the
+	# merged rows are written, a block at a time: BLOCK rows, or fewer when the blocks of all the runs
+	# would not fit in the memory budget. The merged rows go into arrays of the total length of the runs (an upper bound, as equal keys of
+	# different runs become one row), memory-mapped in the temporary folder, and only the rows that
+	# were filled are copied into memory at the end.
+	def merge(self):
+		grams = []
+		counts = []
+		block = max(1, min(BLOCK, self.maxEntries//(self.runs+1)))
+		for k in range(self.model.order):
+			bound = sum(len(np.load(self.runFile(run, k, 'counts'), mmap_mode='r')) for run in range(self.runs))
+			mergedGrams = np.lib.format.open_memmap(self.runFile('merged', k, 'keys'), mode='w+', dtype=np.int64, shape=(bound, k+1))
+			mergedCounts = np.lib.format.open_memmap(self.runFile('merged', k, 'counts'), mode='w+', dtype=np.int64, shape=(bound,))
+			rows = 0
+			keys = []
+			total = []
+			for key, count in heapq.merge(*[self.readRun(run, k, block) for run in range(self.runs)]):
+				if keys and keys[-1]==key:
+					total[-1] += count
+					continue
+				if len(keys)==block:
+					mergedGrams[rows:rows+block] = unpackKeys(keys, k)
+					mergedCounts[rows:rows+block] = total
+					rows += block
+					keys = []
+					total = []
+				keys.append(key)
+				total.append(count)
+			mergedGrams[rows:rows+len(keys)] = unpackKeys(keys, k)
+			mergedCounts[rows:rows+len(keys)] = total
+			rows += len(keys)
+			grams.append(np.array(mergedGrams[:rows]))
+			counts.append(np.array(mergedCounts[:rows]))
+			del mergedGrams, mergedCounts
+		return grams, counts
+
+	def close(self):
+		shutil.rmtree(self.tempDir, ignore_errors=True)
+
+# Train model (an empty NgramModel, with its order and vocabulary) on a file counted within memoryBudget bytes.
+def fitExternal(model, filename, memoryBudget=256*1024*1024, tempDir=None):
+	counter = ExternalCounter(model, memoryBudget, tempDir)
+	try:
+		if isCompiled(filename):
+			counter.countCorpus(Corpus(filename))
+		else:
+			with open(filename) as f:
+				counter.countLines(f)
+		grams, counts = counter.merge()
+	finally:
+		counter.close()
+	model.build(grams, counts)
+	return model
+
+if __name__=='__main__':
+	from model_io import saveModel
+	order = int(sys.argv[3]) if len(sys.argv)>3 else 3
+	budget = int(sys.argv[4])*1024*1024 if len(sys.argv)>4 else 256*1024*1024
+	saveModel(fitExternal(NgramModel(order), sys.argv[1], budget), sys.argv[2])
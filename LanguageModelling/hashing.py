@@ -0,0 +1,20 @@
+# 64 bit mixing functions shared by the hashed structures (sketch_model.py, perfect_hash.py,
+# bloom_filter.py): mix on NumPy uint64 arrays and mixInt, the same function on one Python integer.
+# This module imports nothing else of the package, so any of them can use it without import cycles.
+
+# Code
+import numpy as np
+
+MASK=(1<<64)-1
+
+# 64 bit mixing function (splitmix64 finalizer).
+def mix(x):
+	x = (x^(x>>np.uint64(30)))*np.uint64(0xbf58476d1ce4e5b9)
+	x = (x^(x>>np.uint64(27)))*np.uint64(0x94d049bb133111eb)
+	return x^(x>>np.uint64(31))
+
+# mix on one Python integer.
+def mixInt(x):
+	x = ((x^(x>>30))*0xbf58476d1ce4e5b9)&MASK
+	x = ((x^(x>>27))*0x94d049bb133111eb)&MASK
+	return x^(x>>31)
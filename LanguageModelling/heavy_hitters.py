@@ -0,0 +1,52 @@
+# Streaming top-K vocabulary in bounded memory (Misra-Gries "frequent items").
+# wordFrequencies keeps a count for every distinct token, and on Twitter text most of them are hashtags
+# and typos seen once. MisraGries keeps at most capacity counters instead:
+#   - a word that has a counter gets it increased,
+#   - a new word gets a counter if there is room,
+#   - otherwise every counter is decreased by one and those that reach 0 are dropped.
+# Every kept count is at most `decrements` below the true count, and decrements <= n/(capacity+1)
+# for n tokens, so any word seen more than n/(capacity+1) times is sure to be kept.
+
+# Code
+from tokenizer import wordpunct_tokenize
+
+class MisraGries(object):
+
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.counts = {}
+		self.decrements = 0	# Largest amount by which a kept count can be below the true count
+		self.tokens = 0
+
+	def add(self, word):
+		self.tokens+=1
+		counts = self.counts
+		if word in counts:
+			counts[word]+=1
+		elif len(counts)<self.capacity:
+			counts[word] = 1
+		else:
+			self.decrements+=1
+			for w in list(counts):
+				if counts[w]==1:
+					del counts[w]
+				else:
+					counts[w]-=1
+
+	def addLines(self, lines):
+		for line in lines:
+			for word in wordpunct_tokenize(line):
+				self.add(word)
+		return self
+
+	# The top words by estimated count among those estimated at least minCount times, ties broken alphabetically.
+	def top(self, top=None, minCount=1):
+		counts = self.counts
+		words = sorted([word for word in counts if counts[word]>=minCount], key=lambda word: (-counts[word], word))
+		return words[:top] if top is not None else words
+
+# The top most frequent words of the lines in one pass with O(capacity) memory (2*top counters by default),
+# and the error bound of their counts.
+def streamingTopWords(lines, top, minCount=1, capacity=None):
+	summary = MisraGries(capacity or 2*top).addLines(lines)
+	return summary.top(top, minCount), summary.decrements
@@ -0,0 +1,93 @@
+# Per-stage timing and memory of a run, to see which phase of a slow run is to blame.
+#   with instruments.stage('count'): ...	time of the stage, peak RSS after it and, with traceMemory,
+#						the tracemalloc peak during it (before Python 3.9, of the
+#						memory allocated during it only)
+#   instruments.accumulate('bigram', s)		time spent in a step that runs many times inside a stage
+#   instruments.count('tokens', n)		counters (tokens, n-grams, ...)
+# With profile set to a file name, the whole run is also profiled with cProfile and the stats are
+# dumped there (read them with pstats). summary() gives everything as one dict and report() prints
+# it as one line of JSON, on stderr so that the output of the run is unchanged.
+# tracemalloc only exists from Python 3.4, so traceMemory does nothing on Python 2.
+
+# Code
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+def peakRss():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss	# kB on Linux
+
+class Instrumentation(object):
+
+	def __init__(self, traceMemory=False, profile=None):
+		self.traceMemory = traceMemory and tracemalloc is not None
+		self.profile = profile
+		self.stages = []	# (name, measures) in the order the stages ran
+		self.steps = {}		# Accumulated seconds of the steps inside stages
+		self.counters = {}
+		self.start = clock()
+		self.profiler = None
+		if profile:
+			import cProfile
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		if self.traceMemory:
+			tracemalloc.start()
+
+	@contextmanager
+	def stage(self, name):
+		if self.traceMemory:
+			self.resetPeak()
+		start = clock()
+		try:
+			yield
+		finally:
+			measures = {'seconds': clock()-start, 'peakRssKB': peakRss()}
+			if self.traceMemory:
+				measures['tracedPeakKB'] = tracemalloc.get_traced_memory()[1]//1024
+			self.stages.append((name, measures))
+
+	# Start measuring the tracemalloc peak from the current allocations.
+	def resetPeak(self):
+		if hasattr(tracemalloc, 'reset_peak'):
+			tracemalloc.reset_peak()
+		else:
+			tracemalloc.stop()
+			tracemalloc.start()
+
+	def accumulate(self, name, seconds):
+		self.steps[name] = self.steps.get(name, 0.0)+seconds
+
+	def count(self, name, value=1):
+		self.counters[name] = self.counters.get(name, 0)+value
+
+	# Stop the profiler and tracing and dump the profile.
+	def finish(self):
+		if self.profiler is not None:
+			self.profiler.disable()
+			self.profiler.dump_stats(self.profile)
+			self.profiler = None
+		if self.traceMemory and tracemalloc.is_tracing():
+			tracemalloc.stop()
+
+	def summary(self):
+		summary = {'totalSeconds': clock()-self.start, 'peakRssKB': peakRss(),
+			'stages': [dict(measures, name=name) for name, measures in self.stages],
+			'steps': self.steps, 'counters': self.counters}
+		if self.profile:
+			summary['profile'] = self.profile
+		return summary
+
+	def report(self, stream=None):
+		self.finish()
+		stream = stream or sys.stderr
+		stream.write(json.dumps(self.summary(), sort_keys=True)+'\n')
@@ -6,8 +6,8 @@
 # Steps:
 # Preprocess the data (Apply tokenization and stemming).
 # Store all the words(V) in a dictionary with unique id's and their frequencies in a list.
-# Create a V*V matrix with all bigram totalLiness.
-# Apply add-one smoothing on the matrix.
+# Create a V*V matrix with all bigram totalLiness (sparse: only the bigrams that occur are stored).
+# Apply add-one smoothing on the matrix (computed while looking up, the zeros are never stored).
 # For every sentence in the corpus, find probabilities P( word(n)|word(n-1) ) of each word in the sequence and thereby find the perplexity of each sentence.
 # Take the average of all the perplexities.
 # Analyse the perplexities of different models.
@@ -19,11 +19,13 @@
 
 # Code
 import numpy as np
+import scipy.sparse as sparse
+from array import array
 import nltk
 import os
 import sys
 from nltk.stem import PorterStemmer
-from nltk.tokenize import sent_tokenize, word_tokenize, wordpunct_tokenize
+from tokenizer import wordpunct_tokenize
 from bs4 import BeautifulSoup
 import json
 import re
@@ -35,7 +37,11 @@ totalLines=0		# Total number of lines
 tokens=0	# Total number of words in the corpus
 V=0
 V_tri=0
-matrix=np.zeros((1,1))
+matrix=sparse.csr_matrix((1,1))
+matrixShape=(1,1)
+rowIds=array('i')	# COO coordinates of every count added since createMatrix
+colIds=array('i')
+rowTotals=np.zeros(1)	# Sum of every row of matrix, used to normalize it
 wordDict = {}
 bigram_perplex=[]
 trigram_dict={}
@@ -46,8 +52,39 @@ def get_count():
 	return index
 
 def createMatrix(row,col):
-	global matrix
-	matrix = np.zeros((row,col))
+	global matrixShape, rowIds, colIds
+	matrixShape = (row,col)
+	rowIds = array('i')
+	colIds = array('i')
+
+def addCount(row,col):
+	rowIds.append(row)
+	colIds.append(col)
+
+# Sum the COO coordinates into a CSR matrix and keep the row totals.
+def buildMatrix():
+	global matrix, rowTotals
+	rows = np.frombuffer(rowIds, dtype=np.int32)
+	cols = np.frombuffer(colIds, dtype=np.int32)
+	data = np.ones(len(rows), dtype=np.int32)
+	matrix = sparse.coo_matrix((data, (rows, cols)), shape=matrixShape).tocsr()
+	rowTotals = np.asarray(matrix.sum(axis=1)).ravel()
+
+# P(col|row) for arrays of rows and cols. Add-one smoothing is applied here and never stored in the matrix.
+def probabilities(rows, cols, addOne=False):
+	rows = np.asarray(rows)
+	counts = np.asarray(matrix[rows, np.asarray(cols)], dtype=float).ravel()
+	totals = rowTotals[rows].astype(float)
+	if addOne:
+		return (counts+1)/(totals+matrixShape[1])
+	return counts/totals
+
+# Probability distribution over every column of one row.
+def rowProbabilities(row, addOne=False):
+	counts = matrix.getrow(row).toarray().ravel().astype(float)
+	if addOne:
+		return (counts+1)/(rowTotals[row]+matrixShape[1])
+	return counts/rowTotals[row]
 
 def putInDict(filename):
 	global totalLines, tokens, index
@@ -96,13 +133,13 @@ def createBigram():
 			l = len(listOfWords)
 			if l!=0:
 				word = listOfWords[0]
-				matrix[V][wordDict[word][0]]+=1	
+				addCount(V, wordDict[word][0])
 			for i in range(l-1):
 				word = listOfWords[i]
 				next_word = listOfWords[i+1]
-				matrix[wordDict[word][0]][wordDict[next_word][0]]+=1
+				addCount(wordDict[word][0], wordDict[next_word][0])
+	buildMatrix()
 	print wordDict
-	print matrix
 	
 def bigramPerplexity():
 	global filename, totalLines, tokens, index
@@ -113,12 +150,8 @@ def bigramPerplexity():
 			l = len(listOfWords)
 			prob=[]
 			if l!=0:
-				word=listOfWords[0]
-				prob.append(matrix[V][wordDict[word][0]]/float(totalLines))
-			for i in range(l-1):
-				word=listOfWords[i]
-				next_word = listOfWords[i+1]
-				prob.append(matrix[wordDict[word][0]][wordDict[next_word][0]]/float(wordDict[word][1]))
+				ids = [wordDict[word][0] for word in listOfWords]
+				prob = probabilities([V]+ids[:-1], ids)
 			# Find perplexity
 			print prob
 			per=1
@@ -177,8 +210,8 @@ def createTrigram():
 				word2 = listOfWords[i+1]
 				word3 = listOfWords[i+2]
 				s = str([word1,word2])
-				matrix[trigram_dict[s][0]][wordDict[word3][0]]+=1
-	print matrix
+				addCount(trigram_dict[s][0], wordDict[word3][0])
+	buildMatrix()
 
 def trigramPerplexity():
 	global filename, totalLines, tokens, index
@@ -194,12 +227,10 @@ def trigramPerplexity():
 				if l>1:
 					word1=listOfWords[1]
 					prob.append(secondDict[str([word,word1])]/float(totalLines))
-			for i in range(l-2):
-				s = str([listOfWords[i],listOfWords[i+1]])
-				word = listOfWords[i+2]
-				num = matrix[trigram_dict[s][0]][wordDict[word][0]]
-				den = trigram_dict[s][1]
-				prob.append(float(num)/float(den))
+			if l>2:
+				rows = [trigram_dict[str([listOfWords[i],listOfWords[i+1]])][0] for i in range(l-2)]
+				cols = [wordDict[word][0] for word in listOfWords[2:]]
+				prob.extend(probabilities(rows, cols))
 			per=1
 			print prob
 			for p in prob:
@@ -12,257 +12,574 @@
 # Take the average of all the perplexities.
 # Analyse the perplexities of different models.
 
-# Variables:
+# LanguageModel:
 # wordDict: Dictionary which stores all the words.
 # index: To give unique id's to every word in the dictionary.
+# matrix, triMatrix, secondDict: N-gram counts keyed by the packed word ids (bigramKey, trigramKey).
 # V: Vocabulary size.
+# All of them are attributes of a LanguageModel, so several models can live in one process:
+#   model = LanguageModel().fit('train.txt', top=20000)
+#   model.perplexity('test.txt', 2)	or	model.score(["some tweet", ...], 3)
 
 # Code
 import numpy as np
-import nltk
 import os
 import sys
 # from nltk.stem import PorterStemmer
-from nltk.tokenize import sent_tokenize, word_tokenize, wordpunct_tokenize
+from tokenizer import wordpunct_tokenize, tokenizeFile
 import json
 import re
+from array import array
+from ngram_model import wordFrequencies, topWords
+from heavy_hitters import streamingTopWords
+from corpus import Corpus, isCompiled
+from instrumentation import Instrumentation, clock
+from perfect_hash import PerfectHash
+from bloom_filter import BloomFilter
 # porter = PorterStemmer()
 
-# Put words in dictionary
-index=0		# Index of word in dictionary
-totalLines=0		# Total number of lines
-tokens=0	# Total number of words in the corpus
-V=0
-V_tri=0
-matrix={}
-triMatrix = {}
-wordDict = {}
-bigram_perplex=[]
-secondDict={}
-
-def get_count():
-	global index
-	return index
-
-def createBiMatrix():
-	global matrix
-	matrix = {}
-
-def createTriMatrix():
-	global triMatrix
-	triMatrix = {}
-
-def putInDict(filename):
-	global totalLines, tokens, index
-	with open(filename) as file:
-		for line in file:
-			totalLines+=1
-			# line = "My name is Abhishek and the name of the boy who was standing there is not Abhishek"
-			listOfWords = wordpunct_tokenize(line)
-			tokens = tokens + len(listOfWords)
-			for word in listOfWords:
-				# word = porter.stem(word)
-				if word in wordDict:
-					wordDict[word][1]+=1
-				else:
-					wordDict[word] = [index, 1]
-					index+=1
-	# print wordDict
-
-def unigramPerplexity():
-	global filename, totalLines, tokens, index
-	with open(filename) as file:
-		perplexities=[]
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			prob=[]
-			for i in range(l):
-				word=listOfWords[i]
-				prob.append(wordDict[word][1]/float(tokens))
-			per=1
-			for p in prob:
-        			per = per*p
-        		if per!=0:
-        			per=1/float(per)
-        		perplexities.append(pow(per, 1/float(l)))
-	PP=0
-	for i in perplexities:
-		PP=PP+i
-	PP=PP/float(len(perplexities))
-	return PP
-
-def createBigram():
-	global filename, totalLines, tokens, index
-	with open(filename) as file:
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			if l!=0:
-				word = listOfWords[0]
-				key = str(["",word])
-				if key not in matrix:
-					matrix[key] = 1
-				else:
-					matrix[key] += 1	
-				# matrix[V][wordDict[word][0]]+=1	
-			for i in range(l-1):
-				word = listOfWords[i]
-				next_word = listOfWords[i+1]
-				key = str([word,next_word])
-				if key not in matrix:
-					matrix[key] = 1
-				else:
-					matrix[key] += 1
-				# matrix[wordDict[word][0]][wordDict[next_word][0]]+=1
-	# print wordDict
-	# print matrix
-	
-def bigramPerplexity():
-	global filename, totalLines, tokens, index
-	with open(filename) as file:
-		perplexities=[]
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			prob=[]
-			if l!=0:
-				word=listOfWords[0]
-				prob.append(matrix[str(["", word])]/float(totalLines))
-				# prob.append(matrix[V][wordDict[word][0]]/float(totalLines))
-			for i in range(l-1):
-				word=listOfWords[i]
-				next_word = listOfWords[i+1]
-				prob.append(matrix[str([word, next_word])]/float(wordDict[word][1]))
-				# prob.append(matrix[wordDict[word][0]][wordDict[next_word][0]]/float(wordDict[word][1]))
-			# Find perplexity
-			# print prob
-			per=1
-			for p in prob:
-        			per = per*p
-        		if per!=0:
-        			per=1/float(per)
-        		perplexities.append(pow(per, 1/float(l)))
-	# print perplexities
-	PP=0
-	for i in perplexities:
-		PP=PP+i
-	PP=PP/float(len(perplexities))
-	return PP
-
-def trigramDict():
-	global filename, totalLines, tokens, index
-	index=0
-	with open(filename) as file:
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			if l!=0:
-				word=listOfWords[0]
-				if word in secondDict:
-					secondDict[str(word)]+=1
-				else:
-					secondDict[str(word)]=1
-				if l>1:
-					word1=listOfWords[1]
-					s=str([word,word1])
-					if s in secondDict:
-						 secondDict[s]+=1
-					else:
-						secondDict[s]=1
-			# for i in range(l-1):
-			#	s = str([listOfWords[i],listOfWords[i+1]])
-			#	if s in trigram_dict:
-			#		trigram_dict[s][1]+=1
-			#	else:
-			#		trigram_dict[s]=[index, 1]
-			#		index+=1
-	# print "\n"
-	# print trigram_dict
-	# print "\n"
-	# print secondDict
-	# print "\n"
-
-def createTrigram():
-	global filename, totalLines, tokens, index
-	with open(filename) as file:
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			for i in range(l-2):
-				word1 = listOfWords[i]
-				word2 = listOfWords[i+1]
-				word3 = listOfWords[i+2]
-				key = str([word1,word2,word3])
-				if key not in triMatrix:
-					triMatrix[key] = 1
+START=0		# Id of the sentence start, takes the place of "" in the bigram keys
+BITS=21		# Bits given to every word id inside a packed n-gram key
+UNK='<unk>'	# Words left out of the vocabulary, and unseen words when scoring another file
+UNK_ID=1
+BACKOFF=0.4	# Weight of the next lower order for n-grams that were never seen (stupid backoff)
+
+# N-gram keys: word ids packed into one integer, BITS bits per word.
+def bigramKey(w1, w2):
+	return (w1<<BITS)|w2
+
+def trigramKey(w1, w2, w3):
+	return (((w1<<BITS)|w2)<<BITS)|w3
+
+# Token lists of the lines of a text file, or of a compiled corpus folder (corpus.py) without tokenizing.
+def tokenizedLines(filename):
+	if isCompiled(filename):
+		for listOfWords in Corpus(filename).lines():
+			yield listOfWords
+		return
+	for listOfWords in tokenizeFile(filename):
+		yield listOfWords
+
+# Scoring works on the whole corpus at once: every word position gets the log-probability of its
+# n-gram, gathered from sorted key/count arrays, and one np.add.reduceat sums them line by line.
+# Empty lines have no perplexity and are left out.
+# N-grams that were seen keep their relative frequency. One that was never seen (as in most test files)
+# gets BACKOFF times the probability of the same word under the next lower order (stupid backoff), and
+# a word that was never seen, when the vocabulary is not cut down to the top words, the add-one estimate
+# 1/(tokens+V) at every order, without BACKOFF factors. So every position of a test file has a finite
+# log-score, and the model is unchanged on the training text, where every n-gram was seen. These scores
+# do not sum to 1, so as soon as one position backs off the average is a score, not a perplexity, and
+# the script reports it as such.
+
+# Sorted keys and their counts of a count dictionary.
+def tableArrays(table):
+	keys = np.fromiter(table.keys(), dtype=np.int64, count=len(table))
+	counts = np.fromiter(table.values(), dtype=np.float64, count=len(table))
+	order = np.argsort(keys)
+	return keys[order], counts[order]
+
+# Count of every key in query, 0 for the keys that are not in the table
+# (a dictionary, a CountTable or the PerfectHash of a frozen model).
+def lookupCounts(table, query):
+	if isinstance(table, dict):
+		table = CountTable(*tableArrays(table))
+	return table.lookup(query).astype(np.float64)
+
+# N-gram counts as sorted key and count arrays, as the bulk counting of LanguageModel gives them.
+class CountTable(object):
+	__slots__ = ('keys', 'counts')
+
+	def __init__(self, keys, counts):
+		self.keys = keys
+		self.counts = counts
+
+	# Count every key of an array with one np.unique.
+	@classmethod
+	def fromKeys(cls, keys):
+		keys, counts = np.unique(keys, return_counts=True)
+		return cls(keys, counts.astype(np.float64))
+
+	def __len__(self):
+		return len(self.keys)
+
+	def lookup(self, query):
+		if len(self.keys)==0:
+			return np.zeros(len(query))
+		idx = np.searchsorted(self.keys, query)
+		idx[idx==len(self.keys)] = 0
+		return np.where(self.keys[idx]==query, self.counts[idx], 0)
+
+# A count table behind a Bloom filter of its keys (bloom_filter.py): only the query keys that pass the
+# filter are looked up in the table, the others get 0 directly.
+class FilteredTable(object):
+	__slots__ = ('table', 'bloom')
+
+	def __init__(self, table, bloom):
+		self.table = table
+		self.bloom = bloom
+
+	def __len__(self):
+		return len(self.table)
+
+	def nbytes(self):
+		return self.table.nbytes()+len(self.bloom.bits)
+
+	def lookup(self, query):
+		passed = self.bloom.containsAll(query)
+		counts = np.zeros(len(query))
+		counts[passed] = self.table.lookup(query[passed])
+		self.bloom.confirmAll(counts[passed]>0)
+		return counts
+
+# Id found n words before every position of the same line, START if the line begins later.
+def previousIds(ids, starts, lengths, n):
+	prev = np.full(len(ids), START, dtype=np.int64)
+	prev[n:] = ids[:-n]
+	prev[positionsInLine(starts, lengths)<n] = START
+	return prev
+
+def positionsInLine(starts, lengths):
+	return np.arange(lengths.sum())-np.repeat(starts, lengths)
+
+def averagePerplexity(logProb, starts, lengths):
+	perplexities = np.exp(-np.add.reduceat(logProb, starts)/lengths)
+	return perplexities.mean()
+
+# log(num/den), -inf where the n-gram was never seen.
+def logRatio(num, den):
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return np.where(num>0, np.log(num)-np.log(den), -np.inf)
+
+# N-grams scored by backing off: those never seen, and those whose counts cannot be right, with no
+# context count or more occurrences than their context. Only a frozen table (perfect_hash.py) gives
+# such counts, when an n-gram that was never seen passes the fingerprint of another one.
+def unseenCounts(num, den):
+	return (num==0)|(den==0)|(num>den)
+
+# Log-probabilities of an order, BACKOFF times the lower order ones where the n-gram was never seen
+# and the lower order ones unchanged at the positions of words that were never seen (oov).
+def backOff(logProb, unseen, lower, oov):
+	unseen = unseen&~oov
+	logProb[unseen] = np.log(BACKOFF)+lower[unseen]
+	logProb[oov] = lower[oov]
+	return logProb
+
+class LanguageModel(object):
+	__slots__ = ('index', 'totalLines', 'tokens', 'V', 'matrix', 'triMatrix', 'secondDict', 'wordDict', 'idList',
+		'vocabulary', 'corpus', 'lineLengths', 'instruments')
+
+	def __init__(self, instruments=None):
+		self.index=2		# Index of word in dictionary (0 is kept for START and 1 for UNK)
+		self.totalLines=0	# Total number of lines
+		self.tokens=0		# Total number of words in the corpus
+		self.V=0
+		self.matrix={}
+		self.triMatrix={}
+		self.secondDict={}
+		self.wordDict={UNK: [UNK_ID, 0]}
+		self.idList=[[START, 0], self.wordDict[UNK]]	# idList[id] is the same [index, count] list that wordDict holds for the word
+		self.vocabulary=None	# Words kept by buildVocabulary, the others are counted as UNK. None keeps every word.
+		self.corpus=array('l')	# Word ids of every line one after the other, kept so that scoring does not tokenize again
+		self.lineLengths=array('l')	# Number of words in each line of corpus (both are NumPy arrays for a compiled corpus)
+		self.instruments=instruments or Instrumentation()	# Stage timers and counters (instrumentation.py)
+
+	def get_count(self):
+		return self.index
+
+	# Vocabulary stage, then the n-gram tables of the file (a text file or a compiled corpus folder).
+	# top and minCount keep the top most frequent words that occur at least minCount times,
+	# the other words are counted as UNK.
+	# bulk counts the bigrams and trigrams with NumPy over the whole corpus (bulkCount) instead of one
+	# dictionary increment per n-gram; the tables are then CountTables instead of dictionaries.
+	def fit(self, filename, top=None, minCount=1, streaming=False, bulk=True):
+		if top is not None or minCount>1:
+			with self.instruments.stage('vocabulary'):
+				self.buildVocabulary(filename, top, minCount, streaming)
+		with self.instruments.stage('count'):
+			if bulk:
+				self.readTraining(filename)
+				self.bulkCount()
+			else:
+				self.countNgrams(filename)
+		self.V=self.get_count()-1
+		return self
+
+	# Vocabulary stage (like wfreq2vocab).
+	# streaming finds the top words with Misra-Gries in O(top) memory instead of counting every distinct word.
+	# A compiled corpus already has its word frequencies in one bincount, so it is always counted exactly.
+	def buildVocabulary(self, filename, top=None, minCount=1, streaming=False):
+		if isCompiled(filename):
+			self.vocabulary = set(topWords(Corpus(filename).frequencies(), top, minCount))
+			return
+		with open(filename) as file:
+			if streaming and top is not None:
+				words, error = streamingTopWords(file, top, minCount)
+				print("Vocabulary counts are at most "+str(error)+" below the true counts")
+				self.vocabulary = set(words)
+			else:
+				self.vocabulary = set(topWords(wordFrequencies(file), top, minCount))
+
+	# Put words in dictionary
+	def putInDict(self, listOfWords):
+		wordDict = self.wordDict
+		ids=[]
+		for word in listOfWords:
+			# word = porter.stem(word)
+			if self.vocabulary is not None and word not in self.vocabulary:
+				word = UNK
+			if word in wordDict:
+				wordDict[word][1]+=1
+			else:
+				if self.index>=1<<BITS:
+					raise ValueError("Vocabulary does not fit in "+str(BITS)+"-bit word ids")
+				wordDict[word] = [self.index, 1]
+				self.idList.append(wordDict[word])
+				self.index+=1
+			ids.append(wordDict[word][0])
+		return ids
+
+	def createBigram(self, ids):
+		matrix = self.matrix
+		l = len(ids)
+		if l!=0:
+			key = bigramKey(START, ids[0])
+			if key not in matrix:
+				matrix[key] = 1
+			else:
+				matrix[key] += 1
+		for i in range(l-1):
+			key = bigramKey(ids[i], ids[i+1])
+			if key not in matrix:
+				matrix[key] = 1
+			else:
+				matrix[key] += 1
+
+	# secondDict holds first words under their id and first word pairs under their bigram key.
+	def trigramDict(self, ids):
+		secondDict = self.secondDict
+		l = len(ids)
+		if l!=0:
+			word=ids[0]
+			if word in secondDict:
+				secondDict[word]+=1
+			else:
+				secondDict[word]=1
+			if l>1:
+				s=bigramKey(word, ids[1])
+				if s in secondDict:
+					 secondDict[s]+=1
 				else:
-					triMatrix[key] += 1
-				# matrix[trigram_dict[s][0]][wordDict[word3][0]]+=1
-	# print triMatrix
-
-def trigramPerplexity():
-	global filename, totalLines, tokens, index
-	with open(filename) as file:
-		perplexities=[]
-		for line in file:
-			listOfWords = wordpunct_tokenize(line)
-			l = len(listOfWords)
-			prob=[]
-			if l!=0:
-				word=listOfWords[0]
-				prob.append(secondDict[str(word)]/float(totalLines))		
-				if l>1:
-					word1=listOfWords[1]
-					prob.append(secondDict[str([word,word1])]/float(totalLines))
-			for i in range(l-2):
-				word1 = listOfWords[i]
-				word2 = listOfWords[i+1]
-				word3 = listOfWords[i+2]
-				s = str([word1,word2])
-				num = triMatrix[str([word1,word2,word3])]
-				# num = matrix[trigram_dict[s][0]][wordDict[word][0]]
-				den = matrix[s]
-				prob.append(float(num)/float(den))
-			per=1
-			# print prob
-			for p in prob:
-        			per = per*p
-        		if per!=0:
-        			per=1/float(per)
-        		perplexities.append(pow(per, 1/float(l)))
-	PP=0
-	# print perplexities
-	for i in perplexities:
-		PP=PP+i
-	PP=PP/float(len(perplexities))
-	return PP
+					secondDict[s]=1
+
+	def createTrigram(self, ids):
+		triMatrix = self.triMatrix
+		l = len(ids)
+		for i in range(l-2):
+			key = trigramKey(ids[i], ids[i+1], ids[i+2])
+			if key not in triMatrix:
+				triMatrix[key] = 1
+			else:
+				triMatrix[key] += 1
+
+	# Tokenize every line once and build the unigram, sentence-start, bigram and trigram tables in the same pass.
+	# The time of every table is added up in instruments, as they are built line by line in the same loop.
+	def countNgrams(self, filename):
+		dictionaryTime = bigramTime = trigramTime = 0.0
+		for listOfWords in tokenizedLines(filename):
+			self.totalLines+=1
+			self.tokens = self.tokens + len(listOfWords)
+			t0 = clock()
+			ids = self.putInDict(listOfWords)
+			self.corpus.extend(ids)
+			self.lineLengths.append(len(ids))
+			t1 = clock()
+			self.createBigram(ids)
+			t2 = clock()
+			self.trigramDict(ids)
+			self.createTrigram(ids)
+			t3 = clock()
+			dictionaryTime += t1-t0
+			bigramTime += t2-t1
+			trigramTime += t3-t2
+		self.instruments.accumulate('dictionary', dictionaryTime)
+		self.instruments.accumulate('bigram', bigramTime)
+		self.instruments.accumulate('trigram', trigramTime)
+
+	# Once training is done the n-gram key sets never change, so the count tables can be replaced by
+	# minimal perfect hashes (perfect_hash.py): a few bytes per n-gram instead of a dictionary entry or
+	# a sorted key, with O(1) lookups. An n-gram that was never seen is rejected by its fingerprint, except
+	# with probability 2**-16, in which case it gets the count of another n-gram.
+	def freeze(self):
+		tables = []
+		for table in (self.matrix, self.triMatrix, self.secondDict):
+			filtered = table if isinstance(table, FilteredTable) else None
+			if filtered is not None:
+				table = filtered.table
+			if isinstance(table, dict):
+				table = CountTable(*tableArrays(table))
+			table = PerfectHash(table.keys, table.counts.astype(np.uint32))
+			if filtered is not None:
+				table = FilteredTable(table, filtered.bloom)
+			tables.append(table)
+		self.matrix, self.triMatrix, self.secondDict = tables
+		return self
+
+	# Put a Bloom filter with the given false positive rate in front of each count table, so that most
+	# n-grams that were never seen (most trigrams of a test file) skip the table lookup. The filters
+	# are built from the keys of the tables, so they go on after counting and before freeze.
+	def addBloomFilters(self, falsePositiveRate=0.01):
+		tables = []
+		for table in (self.matrix, self.triMatrix, self.secondDict):
+			if isinstance(table, dict):
+				table = CountTable(*tableArrays(table))
+			bloom = BloomFilter(len(table), falsePositiveRate)
+			bloom.add(table.keys)
+			tables.append(FilteredTable(table, bloom))
+		self.matrix, self.triMatrix, self.secondDict = tables
+		return self
+
+	# Counters of the Bloom filters of addBloomFilters, by table.
+	def bloomStats(self):
+		names = ('bigrams', 'trigrams', 'sentenceStarts')
+		tables = (self.matrix, self.triMatrix, self.secondDict)
+		return dict((name, table.bloom.stats()) for name, table in zip(names, tables) if isinstance(table, FilteredTable))
+
+	# Word ids of the training file, without counting n-grams (bulkCount does it afterwards).
+	def readTraining(self, filename):
+		if isCompiled(filename):
+			self.readCompiledTraining(Corpus(filename))
+			return
+		dictionaryTime = 0.0
+		for listOfWords in tokenizedLines(filename):
+			self.totalLines+=1
+			self.tokens = self.tokens + len(listOfWords)
+			t0 = clock()
+			ids = self.putInDict(listOfWords)
+			self.corpus.extend(ids)
+			self.lineLengths.append(len(ids))
+			dictionaryTime += clock()-t0
+		self.instruments.accumulate('dictionary', dictionaryTime)
+
+	# readTraining of a compiled corpus without going back to words: every word of its vocabulary gets
+	# its table id once (UNK for the words left out of the vocabulary, the others in order of first
+	# appearance, as putInDict gives them), the ids of the whole corpus are gathered through that
+	# mapping and the word counts come from one bincount.
+	def readCompiledTraining(self, text):
+		t0 = clock()
+		mapping = np.zeros(len(text.vocab), dtype=np.int64)
+		for i in range(2, len(text.vocab)):
+			word = text.vocab[i]
+			if self.vocabulary is not None and word not in self.vocabulary:
+				word = UNK
+			if word not in self.wordDict:
+				if self.index>=1<<BITS:
+					raise ValueError("Vocabulary does not fit in "+str(BITS)+"-bit word ids")
+				self.wordDict[word] = [self.index, 0]
+				self.idList.append(self.wordDict[word])
+				self.index+=1
+			mapping[i] = self.wordDict[word][0]
+		ids = mapping[text.ids]
+		counts = np.bincount(ids, minlength=self.index)
+		for i in np.flatnonzero(counts):
+			self.idList[i][1]+=int(counts[i])
+		self.corpus = ids
+		self.lineLengths = np.diff(text.offsets)
+		self.totalLines+=len(text)
+		self.tokens+=len(ids)
+		self.instruments.accumulate('dictionary', clock()-t0)
+
+	# Bigram, sentence-start and trigram tables of the whole corpus at once. The n-gram of every position
+	# comes from shifted views of the id array (previousIds, which put START where a window would cross
+	# the start of its line), is packed into one int64 key and every table is counted with np.unique.
+	# The sorted keys and counts are the lookup structure of scoring (np.searchsorted).
+	def bulkCount(self):
+		start = clock()
+		ids, starts, lengths = self.corpusArrays()
+		pos = positionsInLine(starts, lengths)
+		prev1 = previousIds(ids, starts, lengths, 1)
+		bigrams = bigramKey(prev1, ids)
+		self.matrix = CountTable.fromKeys(bigrams)
+		t1 = clock()
+		# First words under their id, first pairs under their bigram key, as trigramDict keeps them.
+		self.secondDict = CountTable.fromKeys(np.concatenate((ids[pos==0], bigrams[pos==1])))
+		third = pos>=2
+		self.triMatrix = CountTable.fromKeys(trigramKey(previousIds(ids, starts, lengths, 2)[third], prev1[third], ids[third]))
+		self.instruments.accumulate('bigram', t1-start)
+		self.instruments.accumulate('trigram', clock()-t1)
+
+	# Word ids and line lengths of token lists, to score them against the tables. Unseen words become UNK.
+	def readLines(self, lines):
+		unknown = self.idList[UNK_ID]
+		ids=array('l')
+		lengths=array('l')
+		for listOfWords in lines:
+			ids.extend([self.wordDict.get(word, unknown)[0] for word in listOfWords])
+			lengths.append(len(listOfWords))
+		return ids, lengths
+
+	# readLines of another file. A compiled corpus is mapped to the table ids with one gather.
+	def readCorpus(self, filename):
+		if isCompiled(filename):
+			text = Corpus(filename)
+			mapping = np.array([self.wordDict.get(word, self.idList[UNK_ID])[0] for word in text.vocab], dtype=np.int64)
+			return mapping[text.ids], np.diff(text.offsets)
+		return self.readLines(tokenizedLines(filename))
+
+	# Word ids of the corpus, where every non-empty line starts in it and how long it is.
+	# text is the (ids, lengths) of readCorpus, the training corpus by default.
+	def corpusArrays(self, text=None):
+		ids, lengths = text or (self.corpus, self.lineLengths)
+		ids = np.array(ids, dtype=np.int64)
+		lengths = np.array(lengths, dtype=np.int64)
+		lengths = lengths[lengths!=0]
+		starts = np.cumsum(lengths)-lengths
+		return ids, starts, lengths
+
+	# Log-probability of every word of text under the unigram, bigram or trigram tables (order 1, 2 or 3),
+	# with the start and length of every non-empty line.
+	def logProbs(self, order, text=None):
+		return self.scoredLogProbs(order, text)[:3]
+
+	# logProbs and whether every word was scored by backing off (or as a word that was never seen).
+	def scoredLogProbs(self, order, text=None):
+		ids, starts, lengths = self.corpusArrays(text)
+		counts = np.array([entry[1] for entry in self.idList], dtype=np.float64)
+		oov = counts[ids]==0
+		logProb = logRatio(counts[ids], float(self.tokens))
+		logProb[oov] = -np.log(self.tokens+self.V)
+		if order==1:
+			return logProb, starts, lengths, oov
+		prev1 = previousIds(ids, starts, lengths, 1)
+		counts[START] = self.totalLines
+		num = lookupCounts(self.matrix, bigramKey(prev1, ids))
+		unseen = unseenCounts(num, counts[prev1])
+		logProb = backOff(logRatio(num, counts[prev1]), unseen, logProb, oov)
+		if order==2:
+			return logProb, starts, lengths, unseen
+		prev2 = previousIds(ids, starts, lengths, 2)
+		pos = positionsInLine(starts, lengths)
+		# First word and first pair of a line come from secondDict, the rest are trigrams.
+		num = lookupCounts(self.triMatrix, trigramKey(prev2, prev1, ids))
+		den = lookupCounts(self.matrix, bigramKey(prev2, prev1))
+		first = pos==0
+		num[first] = lookupCounts(self.secondDict, ids[first])
+		second = pos==1
+		num[second] = lookupCounts(self.secondDict, bigramKey(prev1[second], ids[second]))
+		den[pos<2] = self.totalLines
+		unseen = unseenCounts(num, den)
+		return backOff(logRatio(num, den), unseen, logProb, oov), starts, lengths, unseen
+
+	def unigramPerplexity(self, text=None):
+		return averagePerplexity(*self.logProbs(1, text))
+
+	def bigramPerplexity(self, text=None):
+		return averagePerplexity(*self.logProbs(2, text))
+
+	def trigramPerplexity(self, text=None):
+		return averagePerplexity(*self.logProbs(3, text))
+
+	# Average perplexity of the lines of a file (the training corpus by default) under the model of an order.
+	def perplexity(self, filename=None, order=3):
+		text = self.readCorpus(filename) if filename is not None else None
+		return averagePerplexity(*self.logProbs(order, text))
+
+	# Natural log-probability (log-score when it backs off) of every sentence (0 for a sentence without words) under the model of an order.
+	def score(self, sentences, order=3):
+		ids, lengths = self.readLines([wordpunct_tokenize(sentence) for sentence in sentences])
+		lengths = np.array(lengths, dtype=np.int64)
+		scores = np.zeros(len(lengths))
+		logProb, starts, nonEmpty = self.logProbs(order, (ids, lengths))
+		if len(starts)!=0:
+			scores[lengths!=0] = np.add.reduceat(logProb, starts)
+		return scores
 				
 #########################################################################################
 
+# Print the average perplexity of a model, or its average score when some words had to back off.
+def printResult(name, logProb, starts, lengths, backedOff):
+	value = averagePerplexity(logProb, starts, lengths)
+	if backedOff.any():
+		print(name+" Score = "+str(value)+" ("+str(np.count_nonzero(backedOff))+" of "+str(len(backedOff))+" words backed off or never seen, not a perplexity)")
+	else:
+		print(name+" Perplexity = "+str(value))
+	return value
+
 # Main
-filename=sys.argv[1]
-putInDict(filename)
-V=get_count()
-# Unigram
-unigramPP = unigramPerplexity()
-print "Unigram Perplexity = "+str(unigramPP)
-# Bigram
-createBiMatrix()
-createBigram()
-bigramPP = bigramPerplexity()
-print "Bigram Perplexity = "+str(bigramPP)
-print "==========================================================="
-# Trigram
-index=0
-trigramDict()
-V_tri=get_count()
-createTriMatrix()
-createTrigram()
-trigramPP = trigramPerplexity()
-print "Trigram Perplexity = "+str(trigramPP)
-print "Found perplexity"
-print "Done."
+# Usage: python lan_model_1.py train.txt [test.txt] [-top K] [-min_count N] [-streaming] [-dict_count] [-freeze] [-bloom RATE] [-trace_memory] [-profile out.prof]
+# Scores train.txt itself unless a test file is given. Either file can be a compiled corpus folder. -top and -min_count turn on the vocabulary stage,
+# -streaming picks the top K words in bounded memory.
+# -dict_count counts the n-grams with one dictionary increment each instead of in bulk with NumPy.
+# -freeze scores with minimal perfect hashes of the count tables.
+# -bloom puts Bloom filters with false positive rate RATE in front of the count tables, their counters go to the summary.
+# A JSON summary of the stages (time, peak memory, counters) is printed on stderr at the end of the run,
+# -trace_memory adds the tracemalloc peak of every stage and -profile dumps a cProfile of the run.
+if __name__=='__main__':
+	args=sys.argv[1:]
+	top=None
+	minCount=1
+	profile=None
+	if '-top' in args:
+		top=int(args.pop(args.index('-top')+1))
+		args.remove('-top')
+	if '-min_count' in args:
+		minCount=int(args.pop(args.index('-min_count')+1))
+		args.remove('-min_count')
+	bloomRate=None
+	if '-bloom' in args:
+		bloomRate=float(args.pop(args.index('-bloom')+1))
+		args.remove('-bloom')
+	if '-profile' in args:
+		profile=args.pop(args.index('-profile')+1)
+		args.remove('-profile')
+	streaming='-streaming' in args
+	if streaming:
+		args.remove('-streaming')
+	traceMemory='-trace_memory' in args
+	if traceMemory:
+		args.remove('-trace_memory')
+	bulk='-dict_count' not in args
+	if not bulk:
+		args.remove('-dict_count')
+	instruments=Instrumentation(traceMemory, profile)
+	frozen='-freeze' in args
+	if frozen:
+		args.remove('-freeze')
+	filename=args[0]
+	model=LanguageModel(instruments).fit(filename, top, minCount, streaming, bulk)
+	if bloomRate is not None:
+		with instruments.stage('bloom'):
+			model.addBloomFilters(bloomRate)
+	if frozen:
+		with instruments.stage('freeze'):
+			model.freeze()
+		instruments.count('frozenBytes', sum(table.nbytes() for table in (model.matrix, model.triMatrix, model.secondDict)))
+	instruments.count('lines', model.totalLines)
+	instruments.count('tokens', model.tokens)
+	instruments.count('vocabulary', model.V)
+	instruments.count('bigrams', len(model.matrix))
+	instruments.count('trigrams', len(model.triMatrix))
+	instruments.count('sentenceStarts', len(model.secondDict))
+	text=None
+	if len(args)>1:
+		with instruments.stage('readTest'):
+			text=model.readCorpus(args[1])
+	instruments.count('scoredTokens', len(text[0]) if text else model.tokens)
+	# Unigram
+	with instruments.stage('unigramPerplexity'):
+		unigramPP = printResult("Unigram", *model.scoredLogProbs(1, text))
+	# Bigram
+	with instruments.stage('bigramPerplexity'):
+		bigramPP = printResult("Bigram", *model.scoredLogProbs(2, text))
+	print("===========================================================")
+	# Trigram
+	with instruments.stage('trigramPerplexity'):
+		trigramPP = printResult("Trigram", *model.scoredLogProbs(3, text))
+	print("Found perplexity")
+	print("Done.")
+	for name, stats in sorted(model.bloomStats().items()):
+		for counter in ('queries', 'rejected', 'hits', 'falsePositives'):
+			instruments.count(name+'Bloom'+counter[0].upper()+counter[1:], stats[counter])
+	instruments.report()
 
 # Just for printing
 #for word in wordDict:
@@ -0,0 +1,179 @@
+# Scoring server: loads a saved model once (model_io.loadModel) and scores batches of sentences,
+# so that a job scoring tweets pays neither the imports nor the training on every request.
+#
+# A request is a JSON object {"sentences": [...], "includeUnks": true} and the answer gives, for every
+# sentence, its natural log-probability, the number of words it was computed over and its perplexity
+# exp(-logProb/words) (null for a sentence without words):
+#   {"results": [{"logProb": -23.1, "words": 6, "perplexity": 47.0}, ...]}
+# Over localhost HTTP the request is POSTed to /score, and GET /health describes the model.
+# Over a Unix socket every line is one request and the server writes one line of JSON per request.
+# Requests are served on one thread each; the model is only read, so they share it.
+# Repeated n-grams and sentences are answered from the model's LRU caches (see NgramModel.enableCache),
+# whose hit and miss counters are part of /health. With -bloom, n-grams that were never seen are mostly
+# rejected by Bloom filters (NgramModel.enableBloom) before the trie search, and /health has their counters too.
+#
+# Usage: python lm_server.py model.bin [port | /path/to/socket] [-cache n-grams sentences] [-bloom rate]
+
+# Code
+import os
+import sys
+import stat
+import json
+import numpy as np
+from model_io import loadModel
+
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+try:
+	STRING = basestring	# JSON strings are unicode on Python 2
+except NameError:
+	STRING = str
+
+PORT=8765
+MAX_REQUEST=64*1024*1024	# Largest request body accepted, in bytes
+
+# Scores of a batch of sentences.
+def scoreBatch(model, sentences, includeUnks=True):
+	results = []
+	for sentence in sentences:
+		logProb, words = model.sentenceLogProb(sentence, includeUnks)
+		perplexity = float(np.exp(-logProb/words)) if words!=0 else None
+		results.append({'logProb': float(logProb), 'words': words, 'perplexity': perplexity})
+	return results
+
+# HTTP status and answer (as a dict) to one decoded JSON request. A malformed request gets 400 and an
+# error raised while scoring gets 500, without closing the connection it came from.
+def handleRequest(model, request):
+	if not isinstance(request, dict) or not isinstance(request.get('sentences'), list):
+		return 400, {'error': 'expected {"sentences": [...]}'}
+	if not all(isinstance(sentence, STRING) for sentence in request['sentences']):
+		return 400, {'error': 'every sentence must be a string'}
+	includeUnks = request.get('includeUnks', True)
+	if not isinstance(includeUnks, bool):
+		return 400, {'error': 'includeUnks must be true or false'}
+	try:
+		return 200, {'results': scoreBatch(model, request['sentences'], includeUnks)}
+	except Exception as e:
+		return 500, {'error': 'scoring failed: %s: %s' % (type(e).__name__, e)}
+
+def modelInfo(model):
+	return {'order': model.order, 'vocabulary': len(model.vocab), 'lines': model.lines,
+		'ngrams': [len(words) for words in model.words], 'cache': model.cacheStats(),
+		'bloom': model.bloomStats()}
+
+class ScoringHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def __init__(self, model, address):
+		HTTPServer.__init__(self, address, ScoringHTTPHandler)
+		self.model = model
+
+class ScoringHTTPHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'	# Keep-alive, so a client can send many batches on one connection
+
+	# close ends the connection after the answer, when the request body could not be read and the
+	# next request would not be found on the connection.
+	def reply(self, status, answer, close=False):
+		body = json.dumps(answer).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		if close:
+			self.send_header('Connection', 'close')
+			self.close_connection = True
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if self.path=='/health':
+			self.reply(200, modelInfo(self.server.model))
+		else:
+			self.reply(404, {'error': 'unknown path '+self.path})
+
+	def do_POST(self):
+		if self.path!='/score':
+			self.reply(404, {'error': 'unknown path '+self.path})
+			return
+		length = self.headers.get('Content-Length') or '0'
+		if not length.isdigit():
+			self.reply(400, {'error': 'bad Content-Length '+length}, close=True)
+			return
+		length = int(length)
+		if length>MAX_REQUEST:
+			self.reply(413, {'error': 'request larger than %d bytes' % MAX_REQUEST}, close=True)
+			return
+		try:
+			request = json.loads(self.rfile.read(length).decode('utf-8'))
+		except ValueError:
+			self.reply(400, {'error': 'request is not JSON'})
+			return
+		self.reply(*handleRequest(self.server.model, request))
+
+	def log_message(self, format, *args):
+		pass
+
+class ScoringUnixServer(ThreadingMixIn, UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, model, path):
+		# Only a socket left by an earlier server is replaced, never a file given here by mistake.
+		if os.path.exists(path):
+			if not stat.S_ISSOCK(os.stat(path).st_mode):
+				raise ValueError(path+" exists and is not a socket")
+			os.remove(path)
+		UnixStreamServer.__init__(self, path, ScoringLineHandler)
+		self.model = model
+
+# One JSON request per line, answered by one line.
+class ScoringLineHandler(StreamRequestHandler):
+
+	def handle(self):
+		for line in self.rfile:
+			line = line.strip()
+			if not line:
+				continue
+			try:
+				status, answer = handleRequest(self.server.model, json.loads(line.decode('utf-8')))
+			except ValueError:
+				answer = {'error': 'request is not JSON'}
+			self.wfile.write(json.dumps(answer).encode('utf-8')+b'\n')
+			self.wfile.flush()
+
+# Server for a port number (localhost HTTP) or a path (Unix socket).
+def createServer(model, address=PORT):
+	if isinstance(address, int) or str(address).isdigit():
+		return ScoringHTTPServer(model, ('127.0.0.1', int(address)))
+	return ScoringUnixServer(model, address)
+
+if __name__=='__main__':
+	args = sys.argv[1:]
+	cache = (100000, 10000)
+	if '-cache' in args:
+		i = args.index('-cache')
+		cache = (int(args[i+1]), int(args[i+2]))
+		del args[i:i+3]
+	bloomRate = None
+	if '-bloom' in args:
+		i = args.index('-bloom')
+		bloomRate = float(args[i+1])
+		del args[i:i+2]
+	model = loadModel(args[0])
+	model.enableCache(*cache)
+	if bloomRate is not None:
+		model.enableBloom(bloomRate)
+	address = args[1] if len(args)>1 else PORT
+	server = createServer(model, address)
+	print("Serving %s on %s" % (args[0], address))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if not isinstance(server, ScoringHTTPServer) and os.path.exists(address):
+			os.remove(address)
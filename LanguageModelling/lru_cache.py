@@ -0,0 +1,50 @@
+# Bounded least recently used cache, for the scores that a stream of tweets asks for again and again
+# (retweets, boilerplate). It holds at most capacity entries: a hit moves the entry to the end of an
+# OrderedDict, and adding to a full cache drops the entry at the front, the least recently used one.
+# hits and misses are counted so that the size can be tuned on real traffic.
+# A lock makes it safe to share between the threads of lm_server.py.
+
+# Code
+import threading
+from collections import OrderedDict
+
+class LRUCache(object):
+
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def __len__(self):
+		return len(self.entries)
+
+	# Value of key (now the most recently used), None if it is not in the cache.
+	def get(self, key):
+		with self.lock:
+			value = self.entries.pop(key, None)
+			if value is None:
+				self.misses+=1
+				return None
+			self.hits+=1
+			self.entries[key] = value
+			return value
+
+	def put(self, key, value):
+		if self.capacity<=0:
+			return
+		with self.lock:
+			self.entries.pop(key, None)
+			if len(self.entries)>=self.capacity:
+				self.entries.popitem(last=False)
+			self.entries[key] = value
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		lookups = self.hits+self.misses
+		return {'capacity': self.capacity, 'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+			'hitRate': self.hits/float(lookups) if lookups else 0.0}
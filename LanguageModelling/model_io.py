@@ -0,0 +1,280 @@
+# Saving and loading a trained NgramModel, so that it is not retrained on every run.
+#
+# ARPA: the standard text format (log10 probabilities and backoff weights), for exchanging models
+# with other toolkits. Reading an ARPA file gives a model without counts.
+#
+# Binary: one file holding the trie arrays as they are in memory:
+#   "NGRAMLM1" | header length (8 bytes) | JSON header | arrays, each starting on an 8 byte boundary.
+# The header gives the dtype, shape and offset of every array, and loadBinary opens each of them
+# with a read-only np.memmap. Loading only reads the header and the vocabulary, the rest is paged in
+# on demand and the pages are shared by every process that opens the same file.
+#
+# Quantized binary (saveBinary with bits=8 or 16): the log-probabilities and backoff weights of every
+# order are stored as 8 or 16 bit codes into a table of 2**bits values of that order (-inf gets a code
+# of its own). The values are found from the distribution of the order: equal-count bins, then a few
+# Lloyd (1-D k-means) iterations. A loaded model reads them through QuantizedArray, still memory-mapped.
+# For deployment the counts can be left out as well (counts=False): they are only needed by update().
+#
+# Usage: python model_io.py train.txt|train.corpus model.arpa|model.bin [order] [-quantize 8|16] [-no_counts]
+#        python model_io.py -update model.bin new.txt [updated.bin]   (adds new.txt to a saved model, kept as quantized as it was)
+
+# Code
+import os
+import sys
+import json
+import struct
+import numpy as np
+from ngram_model import NgramModel, START, UNK
+from corpus import Corpus, isCompiled
+
+MAGIC=b'NGRAMLM1'
+LLOYD_ITERATIONS=10	# Refinements of the quantization values
+LOG10=np.log(10)
+ARPA_ZERO=-99.0	# log10 probability written for impossible n-grams (<s> as a unigram)
+
+# Natural log -> log10 for an ARPA file.
+def toLog10(value):
+	if value==float('-inf'):
+		return ARPA_ZERO
+	return value/LOG10
+
+def writeArpa(model, filename):
+	with open(filename, 'w') as f:
+		f.write('\n\\data\\\n')
+		for k in range(model.order):
+			f.write('ngram %d=%d\n' % (k+1, len(model.words[k])))
+		for k in range(model.order):
+			f.write('\n\\%d-grams:\n' % (k+1))
+			grams = model.levelGrams(k)
+			for i in range(len(grams)):
+				words = ' '.join([model.vocab[w] for w in grams[i]])
+				if k<model.order-1:
+					f.write('%.6f\t%s\t%.6f\n' % (toLog10(model.logProbs[k][i]), words, toLog10(model.backoffs[k][i])))
+				else:
+					f.write('%.6f\t%s\n' % (toLog10(model.logProbs[k][i]), words))
+		f.write('\n\\end\\\n')
+
+def readArpa(filename):
+	sections = []	# sections[k]: list of (words, log10 prob, log10 backoff) of order k+1
+	with open(filename) as f:
+		k = -1
+		for line in f:
+			line = line.strip()
+			if line=='' or line.startswith('ngram ') or line=='\\data\\' or line=='\\end\\':
+				continue
+			if line.startswith('\\') and line.endswith('-grams:'):
+				k = int(line[1:-7])-1
+				sections.append([])
+				continue
+			parts = line.split()
+			backoff = float(parts[k+2]) if len(parts)>k+2 else 0.0
+			sections[k].append((parts[1:k+2], float(parts[0]), backoff))
+	model = NgramModel(len(sections))
+	for words, logProb, backoff in sections[0]:
+		if words[0] not in model.wordIds:
+			model.wordIds[words[0]] = len(model.vocab)
+			model.vocab.append(words[0])
+	# <s> and <unk> always have a unigram entry, even if the file has none for them.
+	unigrams = dict((words[0], (logProb, backoff)) for words, logProb, backoff in sections[0])
+	unigrams.setdefault(START, (ARPA_ZERO, 0.0))
+	unigrams.setdefault(UNK, (ARPA_ZERO, 0.0))
+	sections[0] = [([word],)+unigrams[word] for word in model.vocab]
+	grams = []
+	logProbs = []
+	backoffs = []
+	for k in range(model.order):
+		g = np.array([[model.wordIds[w] for w in words] for words, logProb, backoff in sections[k]], dtype=np.int64).reshape(len(sections[k]), k+1)
+		order = np.lexsort(g.T[::-1])
+		grams.append(g[order])
+		logProb = np.array([entry[1] for entry in sections[k]])[order]*LOG10
+		logProb[logProb<=ARPA_ZERO*LOG10] = float('-inf')
+		logProbs.append(logProb.astype(np.float32))
+		backoffs.append((np.array([entry[2] for entry in sections[k]])[order]*LOG10).astype(np.float32))
+	model.layout(grams)
+	model.logProbs = logProbs
+	model.backoffs = backoffs[:-1]
+	return model
+
+# Sorted table of at most 2**bits values that represent the values of an array, -inf included if it occurs.
+def quantizer(values, bits):
+	values = np.asarray(values, dtype=np.float64)
+	finite = np.sort(values[np.isfinite(values)])
+	infinite = len(finite)<len(values)
+	levels = 2**bits-int(infinite)
+	distinct = np.unique(finite)
+	if len(distinct)<=levels:
+		centers = distinct
+	else:
+		# Equal-count bins, then Lloyd iterations: every value goes to its nearest center and every
+		# center moves to the mean of its values.
+		centers = np.array([chunk.mean() for chunk in np.array_split(finite, levels)])
+		for i in range(LLOYD_ITERATIONS):
+			codes = np.searchsorted((centers[:-1]+centers[1:])/2, finite)
+			sums = np.bincount(codes, weights=finite, minlength=levels)
+			sizes = np.bincount(codes, minlength=levels)
+			used = sizes>0
+			centers = np.sort(sums[used]/sizes[used])
+	if infinite:
+		centers = np.concatenate(([float('-inf')], centers))
+	return centers.astype(np.float32)
+
+# Code of the nearest value of centers for every value.
+def quantize(values, centers, bits):
+	centers = centers.astype(np.float64)
+	with np.errstate(invalid='ignore'):
+		boundaries = (centers[:-1]+centers[1:])/2
+	return np.searchsorted(boundaries, np.asarray(values, dtype=np.float64)).astype(np.uint8 if bits==8 else np.uint16)
+
+# Array of quantization codes that reads as the values they stand for.
+class QuantizedArray(object):
+
+	def __init__(self, codes, centers):
+		self.codes = codes
+		self.centers = centers
+
+	def __len__(self):
+		return len(self.codes)
+
+	def __getitem__(self, idx):
+		return self.centers[self.codes[idx]]
+
+	def __array__(self, dtype=None):
+		values = self.centers[self.codes]
+		return values if dtype is None else values.astype(dtype)
+
+# Arrays of the model that go in the binary file, by name, with the log-probabilities and backoff
+# weights quantized to bits bits when bits is given.
+def modelArrays(model, bits=None, counts=True):
+	arrays = []
+	def add(name, values):
+		if bits is None:
+			arrays.append((name, np.asarray(values)))
+		else:
+			centers = quantizer(values, bits)
+			arrays.append((name, quantize(values, centers, bits)))
+			arrays.append((name+'Centers', centers))
+	for k in range(model.order):
+		arrays.append(('words%d' % k, model.words[k]))
+		add('logProbs%d' % k, model.logProbs[k])
+		if counts and k<len(model.counts):
+			arrays.append(('counts%d' % k, model.counts[k]))
+		if k<model.order-1:
+			arrays.append(('offsets%d' % k, model.offsets[k]))
+			add('backoffs%d' % k, model.backoffs[k])
+	vocab = '\n'.join(model.vocab)
+	if not isinstance(vocab, bytes):
+		vocab = vocab.encode('utf-8')
+	arrays.append(('vocab', np.frombuffer(vocab, dtype=np.uint8)))
+	return arrays
+
+def saveBinary(model, filename, bits=None, counts=True):
+	if bits not in (None, 8, 16):
+		raise ValueError("Log-probabilities can be quantized to 8 or 16 bits, not "+str(bits))
+	arrays = modelArrays(model, bits, counts)
+	header = {'order': model.order, 'lines': model.lines, 'closed': model.closed, 'quantized': bits,
+		'discounts': [list(map(float, D)) for D in model.discounts], 'arrays': []}
+	# Offsets depend on the header length, so lay the arrays out until the header stops growing.
+	start = 0
+	while True:
+		offset = start
+		header['arrays'] = []
+		for name, array in arrays:
+			header['arrays'].append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+			offset += (array.nbytes+7)//8*8
+		text = json.dumps(header).encode('utf-8')
+		end = len(MAGIC)+8+len(text)
+		if (end+7)//8*8==start:
+			break
+		start = (end+7)//8*8
+	with open(filename, 'wb') as f:
+		f.write(MAGIC)
+		f.write(struct.pack('<Q', len(text)))
+		f.write(text)
+		f.write(b'\0'*(start-end))
+		for name, array in arrays:
+			data = np.ascontiguousarray(array).tobytes()
+			f.write(data)
+			f.write(b'\0'*((len(data)+7)//8*8-len(data)))
+
+# JSON header of a binary model file.
+def readHeader(filename):
+	with open(filename, 'rb') as f:
+		if f.read(len(MAGIC))!=MAGIC:
+			raise ValueError(filename+" is not a binary n-gram model")
+		length = struct.unpack('<Q', f.read(8))[0]
+		return json.loads(f.read(length).decode('utf-8'))
+
+def loadBinary(filename):
+	header = readHeader(filename)
+	arrays = {}
+	for entry in header['arrays']:
+		shape = tuple(entry['shape'])
+		if shape[0]==0:
+			arrays[entry['name']] = np.zeros(shape, dtype=entry['dtype'])
+		else:
+			arrays[entry['name']] = np.memmap(filename, dtype=entry['dtype'], mode='r', offset=entry['offset'], shape=shape)
+	model = NgramModel(header['order'])
+	vocab = arrays['vocab'].tobytes()
+	if not isinstance(vocab, str):
+		vocab = vocab.decode('utf-8')
+	model.vocab = vocab.split('\n')
+	model.wordIds = dict((model.vocab[i], i) for i in range(len(model.vocab)))
+	model.lines = header['lines']
+	model.closed = header['closed']
+	model.discounts = [np.array(D) for D in header['discounts']]
+	def values(name):
+		if header.get('quantized'):
+			return QuantizedArray(arrays[name], np.array(arrays[name+'Centers']))
+		return arrays[name]
+	model.words = [arrays['words%d' % k] for k in range(model.order)]
+	model.logProbs = [values('logProbs%d' % k) for k in range(model.order)]
+	model.counts = [arrays['counts%d' % k] for k in range(model.order) if 'counts%d' % k in arrays]
+	model.offsets = [arrays['offsets%d' % k] for k in range(model.order-1)]
+	model.backoffs = [values('backoffs%d' % k) for k in range(model.order-1)]
+	return model
+
+def saveModel(model, filename, bits=None, counts=True):
+	if filename.endswith('.arpa'):
+		writeArpa(model, filename)
+	else:
+		saveBinary(model, filename, bits, counts)
+
+def loadModel(filename):
+	if filename.endswith('.arpa'):
+		return readArpa(filename)
+	return loadBinary(filename)
+
+# Add the lines of a file to a saved model (one with counts) and save it again, to filename by default,
+# quantized as the saved model was. The new model is written next to it and renamed over it, since
+# the old one may still be mapped.
+def updateModel(filename, newText, output=None):
+	output = output or filename
+	bits = None
+	if not filename.endswith('.arpa'):
+		bits = readHeader(filename).get('quantized')
+	model = loadModel(filename).updateFile(newText)
+	if output.endswith('.arpa'):
+		writeArpa(model, output+'.tmp')
+	else:
+		saveBinary(model, output+'.tmp', bits)
+	os.rename(output+'.tmp', output)
+	return model
+
+if __name__=='__main__':
+	if sys.argv[1]=='-update':
+		updateModel(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv)>4 else None)
+	else:
+		args = sys.argv[1:]
+		bits = None
+		if '-quantize' in args:
+			bits = int(args.pop(args.index('-quantize')+1))
+			args.remove('-quantize')
+		counts = '-no_counts' not in args
+		if not counts:
+			args.remove('-no_counts')
+		order = int(args[2]) if len(args)>2 else 3
+		if isCompiled(args[0]):
+			model = NgramModel(order).fitCorpus(Corpus(args[0]))
+		else:
+			model = NgramModel(order).fitFile(args[0])
+		saveModel(model, args[1], bits, counts)
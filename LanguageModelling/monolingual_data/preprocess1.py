@@ -1,8 +1,11 @@
 # !/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
 import re
+import sys
 import preprocessor as p
-from nltk.tokenize import sent_tokenize, word_tokenize, wordpunct_tokenize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tokenizer import wordpunct_tokenize
 from nltk.stem import PorterStemmer
 porter = PorterStemmer()
 f = open("data/vag.txt","w")
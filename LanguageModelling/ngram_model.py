@@ -0,0 +1,506 @@
+# Arbitrary order n-gram language model.
+#
+# The counts of every order live in one trie that is stored level by level in flat arrays
+# (the layout used by KenLM and BerkeleyLM), so memory grows much slower than with nested dictionaries:
+#   words[k]   : last word id of every (k+1)-gram. The (k+1)-grams that extend the same k-gram are
+#                contiguous and sorted by word id, so a child is found with a binary search.
+#   counts[k]  : count of every (k+1)-gram.
+#   offsets[k] : the children of the i-th (k+1)-gram are words[k+1][offsets[k][i]:offsets[k][i+1]].
+# words[0] holds every word id in order, so a unigram is found directly by its id.
+#
+# Every line is read as "<s> w1 ... wn" and the model predicts w1 ... wn, in the same way
+# lan_model_1.py uses the sentence start.
+#
+# Smoothing is interpolated modified Kneser-Ney (Chen and Goodman). Continuation counts, the three
+# discounts of every order and the backoff weights are computed once in smooth(), and every n-gram
+# in the trie gets its final interpolated log-probability (logProbs) and, when it can be a context,
+# its log backoff weight (backoffs), as in an ARPA file. A query is then only trie lookups.
+
+# Code
+import numpy as np
+from tokenizer import wordpunct_tokenize
+from lru_cache import LRUCache
+from bloom_filter import BloomFilter, gramKeys
+
+START='<s>'	# Sentence start, always word id 0
+UNK='<unk>'	# Unknown word, always word id 1
+
+# Frequency of every word of the lines (text2wfreq of the CMU toolkit).
+def wordFrequencies(lines):
+	freqs = {}
+	for line in lines:
+		for word in wordpunct_tokenize(line):
+			freqs[word] = freqs.get(word, 0)+1
+	return freqs
+
+# The top most frequent words (wfreq2vocab -top of the CMU toolkit) among those seen at least minCount times,
+# ties broken alphabetically. top=None keeps all of them.
+def topWords(freqs, top=None, minCount=1):
+	words = sorted([word for word in freqs if freqs[word]>=minCount], key=lambda word: (-freqs[word], word))
+	return words[:top] if top is not None else words
+
+# Sorted n-gram arrays of the count dictionaries returned by countLines.
+# grams[k] is an array of shape (number of (k+1)-grams, k+1) in lexicographic order and counts[k] their counts.
+def countArrays(tables):
+	grams=[]
+	counts=[]
+	for k in range(len(tables)):
+		table = tables[k]
+		g = np.array(list(table.keys()), dtype=np.int64).reshape(len(table), k+1)
+		c = np.array(list(table.values()), dtype=np.int64)
+		order = np.lexsort(g.T[::-1])
+		grams.append(g[order])
+		counts.append(c[order])
+	return grams, counts
+
+# Add up the counts of repeated rows of an n-gram array, returning the sorted distinct rows and their counts.
+# When the word ids of a row fit together in 63 bits the rows are sorted as packed int64 keys, which is
+# much faster than a lexsort of the columns and gives the same lexicographic order.
+def sumDuplicates(grams, counts):
+	if len(grams)==0:
+		return grams, counts
+	bits = max(1, int(grams.max()).bit_length())
+	if bits*grams.shape[1]<=63:
+		keys = grams[:, 0].copy()
+		for j in range(1, grams.shape[1]):
+			keys = (keys<<bits)|grams[:, j]
+		order = np.argsort(keys)
+		keys = keys[order]
+		starts = np.concatenate(([0], np.flatnonzero(keys[1:]!=keys[:-1])+1))
+	else:
+		order = np.lexsort(grams.T[::-1])
+		sortedGrams = grams[order]
+		starts = np.concatenate(([0], np.flatnonzero((sortedGrams[1:]!=sortedGrams[:-1]).any(axis=1))+1))
+	return grams[order[starts]], np.add.reduceat(counts[order], starts)
+
+# Merge sets of counts (vocab, lines, grams, counts) of consecutive parts of a text, in text order.
+# The words of every vocabulary that are new are appended in their order, so the merged counts have
+# the same ids and counts as counting the whole text at once. Every part is mapped to the merged ids,
+# then all of them are concatenated and summed with one sumDuplicates per order.
+def mergeCounts(parts):
+	vocab = []
+	wordIds = {}
+	mappings = []
+	for part in parts:
+		mapping = np.zeros(len(part[0]), dtype=np.int64)
+		for i in range(len(part[0])):
+			word = part[0][i]
+			if word not in wordIds:
+				wordIds[word] = len(vocab)
+				vocab.append(word)
+			mapping[i] = wordIds[word]
+		mappings.append(mapping)
+	grams = []
+	counts = []
+	for k in range(len(parts[0][2])):
+		g, c = sumDuplicates(np.concatenate([mapping[part[2][k]] for mapping, part in zip(mappings, parts)]),
+			np.concatenate([part[3][k] for part in parts]))
+		grams.append(g)
+		counts.append(c)
+	return vocab, sum(part[1] for part in parts), grams, counts
+
+# Rows of an n-gram array as fixed width byte strings (big-endian ids) that sort in the order of the rows.
+def rowKeys(grams):
+	return np.ascontiguousarray(grams.astype('>i8')).view(np.dtype((np.void, 8*grams.shape[1]))).ravel()
+
+# Add the counts of the sorted distinct rows newGrams to the sorted distinct rows grams, without sorting
+# grams again: the new rows are found with one searchsorted, those already there get their counts
+# added and the others are inserted at their place.
+def insertCounts(grams, counts, newGrams, newCounts):
+	keys = rowKeys(grams)
+	newKeys = rowKeys(newGrams)
+	pos = np.searchsorted(keys, newKeys)
+	found = pos<len(keys)
+	found[found] = keys[pos[found]]==newKeys[found]
+	counts = counts.copy()
+	counts[pos[found]] += newCounts[found]
+	new = ~found
+	return np.insert(grams, pos[new], newGrams[new], axis=0), np.insert(counts, pos[new], newCounts[new])
+
+# Sum of every segment values[offsets[i]:offsets[i+1]].
+def segmentSums(values, offsets):
+	cumulative = np.concatenate(([0], np.cumsum(values)))
+	return cumulative[offsets[1:]]-cumulative[offsets[:-1]]
+
+# Modified Kneser-Ney discounts D(0), D(1), D(2), D(3+) from the counts of counts of one order.
+def discounts(counts):
+	n = [np.count_nonzero(counts==i) for i in (1, 2, 3, 4)]
+	if min(n)==0:
+		# Too little data to estimate them, fall back to fixed discounts.
+		return np.array([0.0, 0.5, 1.0, 1.5])
+	Y = n[0]/float(n[0]+2*n[1])
+	D = np.array([0.0, 1-2*Y*n[1]/n[0], 2-3*Y*n[2]/n[1], 3-4*Y*n[3]/n[2]])
+	if (D[1:]<=0).any():
+		# Counts of counts that do not fall off (text repeated many times) give discounts of 0 or less,
+		# which would leave no mass for unseen words. Fall back to fixed discounts as well.
+		return np.array([0.0, 0.5, 1.0, 1.5])
+	return np.minimum(D, [0, 1, 2, 3])
+
+class NgramModel(object):
+
+	# vocabulary: optional fixed list of words. Other words are then counted as UNK,
+	# otherwise every word seen in training joins the vocabulary.
+	def __init__(self, order=3, vocabulary=None):
+		self.order = order
+		self.wordIds = {START: 0, UNK: 1}	# word -> id
+		self.vocab = [START, UNK]		# id -> word
+		self.closed = vocabulary is not None
+		for word in vocabulary or []:
+			if word not in self.wordIds:
+				self.wordIds[word] = len(self.vocab)
+				self.vocab.append(word)
+		self.lines = 0			# Number of non-empty lines the model was trained on
+		self.words = []
+		self.counts = []
+		self.offsets = []
+		self.logProbs = []		# logProbs[k][i]: log P of the i-th (k+1)-gram given its first k words
+		self.backoffs = []		# backoffs[k][i]: log backoff weight of the i-th (k+1)-gram as a context
+		self.discounts = []		# discounts[k]: D(0), D(1), D(2), D(3+) of order k+1
+		# A model loaded from an ARPA file has logProbs and backoffs but no counts.
+		self.probCache = None		# LRUCache of logProb by n-gram, see enableCache
+		self.sentenceCache = None	# LRUCache of sentenceLogProb by normalized line
+		self.blooms = None		# blooms[k]: BloomFilter of the (k+1)-grams, see enableBloom
+		self.bloomRate = None
+
+	# Word ids of a line, unknown words map to UNK.
+	def lineIds(self, line):
+		return [self.wordIds.get(word, 1) for word in wordpunct_tokenize(line)]
+
+	# Tokenize every line once and count all of its n-grams up to self.order,
+	# into new count dictionaries or added to tables.
+	def countLines(self, lines, tables=None):
+		if tables is None:
+			tables = [{} for k in range(self.order)]
+		for line in lines:
+			listOfWords = wordpunct_tokenize(line)
+			if len(listOfWords)==0:
+				continue
+			self.lines+=1
+			ids = [0]
+			for word in listOfWords:
+				if word not in self.wordIds:
+					if self.closed:
+						word = UNK
+					else:
+						self.wordIds[word] = len(self.vocab)
+						self.vocab.append(word)
+				ids.append(self.wordIds[word])
+			self.countIds(tuple(ids), tables)
+		return tables
+
+	# Count the n-grams of one line given as a tuple of word ids starting with <s>.
+	def countIds(self, ids, tables):
+		for k in range(self.order):
+			table = tables[k]
+			for i in range(len(ids)-k):
+				key = ids[i:i+k+1]
+				table[key] = table.get(key, 0)+1
+
+	# Ids of the model for every word of a compiled corpus (see corpus.py), its words joining an open vocabulary.
+	def corpusIds(self, corpus):
+		if not self.closed:
+			for word in corpus.vocab:
+				if word not in self.wordIds:
+					self.wordIds[word] = len(self.vocab)
+					self.vocab.append(word)
+		return corpus.idMap(self.wordIds)
+
+	# countLines for the lines start to end (all of them by default) of a compiled corpus, whose lines
+	# are already word ids. mapping is the corpusIds of the corpus, found again when it is not given.
+	def countCorpus(self, corpus, tables=None, start=0, end=None, mapping=None):
+		if tables is None:
+			tables = [{} for k in range(self.order)]
+		if mapping is None:
+			mapping = self.corpusIds(corpus)
+		for i in range(start, len(corpus) if end is None else end):
+			line = corpus.lineIds(i)
+			if len(line)==0:
+				continue
+			self.lines+=1
+			self.countIds((0,)+tuple(mapping[line].tolist()), tables)
+		return tables
+
+	def fit(self, lines):
+		grams, counts = countArrays(self.countLines(lines))
+		self.build(grams, counts)
+		return self
+
+	def fitFile(self, filename):
+		with open(filename) as file:
+			return self.fit(file)
+
+	def fitCorpus(self, corpus):
+		grams, counts = countArrays(self.countCorpus(corpus))
+		self.build(grams, counts)
+		return self
+
+	# Add the counts of new lines to a trained model without counting the old text again.
+	# Only the new lines are tokenized and counted, with the ids of the model (new words get the next
+	# ids), so their sorted n-grams are merged into the sorted levels of the trie with insertCounts and
+	# the old n-grams are never sorted again. The model is then smoothed again: the Kneser-Ney discounts
+	# and continuation counts depend on the counts of every n-gram, so the (vectorized) smoothing pass
+	# runs over the whole trie. The result is the model fitted on the old and the new lines together.
+	def update(self, lines):
+		if len(self.counts)<self.order:
+			raise ValueError("The model has no counts to update (it was read from an ARPA file or saved with -no_counts)")
+		delta = NgramModel(self.order)
+		delta.closed = self.closed
+		delta.vocab = list(self.vocab)
+		delta.wordIds = dict(self.wordIds)
+		newGrams, newCounts = countArrays(delta.countLines(lines))
+		V = len(delta.vocab)
+		unigramCounts = np.zeros(V, dtype=np.int64)
+		unigramCounts[:len(self.vocab)] = self.counts[0]
+		unigramCounts[newGrams[0][:, 0]] += newCounts[0]
+		grams = [np.arange(V, dtype=np.int64).reshape(V, 1)]
+		counts = [unigramCounts]
+		for k in range(1, self.order):
+			g, c = insertCounts(self.levelGrams(k), np.asarray(self.counts[k], dtype=np.int64), newGrams[k], newCounts[k])
+			grams.append(g)
+			counts.append(c)
+		self.vocab = delta.vocab
+		self.wordIds = delta.wordIds
+		self.lines += delta.lines
+		self.build(grams, counts)
+		return self
+
+	def updateFile(self, filename):
+		with open(filename) as file:
+			return self.update(file)
+
+	# Build the trie from the sorted n-gram arrays and smooth it.
+	def build(self, grams, counts):
+		self.layout(grams)
+		unigramCounts = np.zeros(len(self.vocab), dtype=np.int64)
+		unigramCounts[grams[0][:, 0]] = counts[0]
+		self.counts = [unigramCounts]+list(counts[1:])
+		self.smooth()
+		self.clearCache()
+		if self.blooms is not None:
+			self.enableBloom(self.bloomRate)
+
+	# Lay the sorted n-gram arrays out as the trie levels (words and offsets).
+	def layout(self, grams):
+		self.words = [np.arange(len(self.vocab), dtype=np.int32)]
+		self.offsets = []
+		for k in range(1, self.order):
+			# grams[k] is sorted, so the parents are in order and the children of a parent are sorted.
+			parents = self.locate(grams[k][:, :k])
+			self.offsets.append(np.searchsorted(parents, np.arange(len(self.words[k-1])+1)).astype(np.int64))
+			self.words.append(grams[k][:, k].astype(np.int32))
+
+	# Trie index of every row of an array of k-grams that are all in the trie.
+	def locate(self, grams):
+		V = len(self.vocab)
+		idx = grams[:, 0]
+		for k in range(1, grams.shape[1]):
+			# Sorted by (parent, word), so parent*V+word is increasing along the level.
+			idx = np.searchsorted(self.parents(k)*V+self.words[k], idx*V+grams[:, k])
+		return idx
+
+	# Index in level k-1 of the parent of every n-gram of level k.
+	def parents(self, k):
+		return np.repeat(np.arange(len(self.words[k-1])), np.diff(self.offsets[k-1]))
+
+	# Word ids of every n-gram of level k, one row each.
+	def levelGrams(self, k):
+		idx = np.arange(len(self.words[k]))
+		columns = []
+		for j in range(k, -1, -1):
+			columns.append(self.words[j][idx])
+			if j>0:
+				idx = self.parents(j)[idx]
+		return np.stack(columns[::-1], axis=1).astype(np.int64)
+
+	# Kneser-Ney counts of every level: the number of distinct words seen before an n-gram,
+	# except at the highest order and for n-grams starting with <s>, which keep their counts.
+	def adjustedCounts(self):
+		adjusted = []
+		for k in range(self.order-1):
+			a = np.bincount(self.locate(self.levelGrams(k+1)[:, 1:]), minlength=len(self.words[k]))
+			first = self.levelGrams(k)[:, 0]==0
+			a[first] = self.counts[k][first]
+			adjusted.append(a.astype(np.int64))
+		adjusted.append(self.counts[self.order-1].copy())
+		adjusted[0][0] = 0	# <s> is never predicted
+		return adjusted
+
+	# Interpolated modified Kneser-Ney log-probabilities and backoff weights of every n-gram in the trie.
+	def smooth(self):
+		adjusted = self.adjustedCounts()
+		self.discounts = [discounts(a) for a in adjusted]
+		self.logProbs = []
+		self.backoffs = []
+		# Unigrams interpolate with the uniform distribution over the vocabulary (without <s>).
+		a = adjusted[0]
+		D = self.discounts[0]
+		total = float(a.sum())
+		gamma = (D[1]*np.count_nonzero(a==1)+D[2]*np.count_nonzero(a==2)+D[3]*np.count_nonzero(a>=3))/total
+		probs = np.maximum(a-D[np.minimum(a, 3)], 0)/total+gamma/(len(self.vocab)-1)
+		probs[0] = 0
+		with np.errstate(divide='ignore'):
+			self.logProbs.append(np.log(probs).astype(np.float32))
+		for k in range(1, self.order):
+			a = adjusted[k]
+			D = self.discounts[k]
+			offsets = self.offsets[k-1]
+			# Statistics of every context, the n-grams of level k-1.
+			total = segmentSums(a, offsets).astype(np.float64)
+			weight = D[1]*segmentSums(a==1, offsets)+D[2]*segmentSums(a==2, offsets)+D[3]*segmentSums(a>=3, offsets)
+			gamma = np.ones(len(total))
+			seen = total>0
+			gamma[seen] = weight[seen]/total[seen]
+			self.backoffs.append(np.log(gamma).astype(np.float32))
+			parent = self.parents(k)
+			lower = np.exp(self.logProbs[k-1][self.locate(self.levelGrams(k)[:, 1:])])
+			probs = np.maximum(a-D[np.minimum(a, 3)], 0)/total[parent]+gamma[parent]*lower
+			self.logProbs.append(np.log(probs).astype(np.float32))
+
+	# Put a Bloom filter (bloom_filter.py) with the given false positive rate in front of every level
+	# above the unigrams, so that find answers most n-grams that were never seen without a trie search.
+	def enableBloom(self, falsePositiveRate=0.01):
+		self.bloomRate = falsePositiveRate
+		self.blooms = [None]
+		for k in range(1, self.order):
+			bloom = BloomFilter(len(self.words[k]), falsePositiveRate)
+			bloom.add(gramKeys(self.levelGrams(k)))
+			self.blooms.append(bloom)
+
+	# Counters of the Bloom filters by order, when they are on.
+	def bloomStats(self):
+		if self.blooms is None:
+			return {}
+		return dict((k+1, self.blooms[k].stats()) for k in range(1, self.order))
+
+	# Index of an n-gram (a list of word ids) in its trie level, None if it was never seen.
+	def find(self, ids):
+		if self.blooms is None or len(ids)<2:
+			return self.searchTrie(ids)
+		bloom = self.blooms[len(ids)-1]
+		if not bloom.containsGram(ids):
+			return None
+		idx = self.searchTrie(ids)
+		bloom.confirm(idx is not None)
+		return idx
+
+	def searchTrie(self, ids):
+		idx = ids[0]
+		if idx<0:
+			return None
+		for k in range(1, len(ids)):
+			lo = self.offsets[k-1][idx]
+			hi = self.offsets[k-1][idx+1]
+			j = lo+np.searchsorted(self.words[k][lo:hi], ids[k])
+			if j==hi or self.words[k][j]!=ids[k]:
+				return None
+			idx = j
+		return idx
+
+	def count(self, ids):
+		idx = self.find(ids)
+		if idx is None:
+			return 0
+		return self.counts[len(ids)-1][idx]
+
+	# Keep up to probabilities n-gram log-probabilities and sentences sentence scores in LRU caches,
+	# for streams that score the same n-grams and lines again and again. 0 turns a cache off.
+	def enableCache(self, probabilities=100000, sentences=10000):
+		self.probCache = LRUCache(probabilities) if probabilities>0 else None
+		self.sentenceCache = LRUCache(sentences) if sentences>0 else None
+
+	def clearCache(self):
+		for cache in (self.probCache, self.sentenceCache):
+			if cache is not None:
+				cache.clear()
+
+	# Hit and miss counters of the caches that are on.
+	def cacheStats(self):
+		stats = {}
+		if self.probCache is not None:
+			stats['probabilities'] = self.probCache.stats()
+		if self.sentenceCache is not None:
+			stats['sentences'] = self.sentenceCache.stats()
+		return stats
+
+	# Natural log P(word | context), context being the previous word ids (at most order-1 of them).
+	def logProb(self, context, word):
+		if self.probCache is None:
+			return self.backoffLogProb(context, word)
+		key = tuple(context)+(word,)
+		logProb = self.probCache.get(key)
+		if logProb is None:
+			logProb = self.backoffLogProb(context, word)
+			self.probCache.put(key, logProb)
+		return logProb
+
+	# Uses the longest suffix of the context that was seen before word, plus the backoff weights
+	# of the longer contexts, as an ARPA backoff model does.
+	def backoffLogProb(self, context, word):
+		backoff = 0.0
+		for start in range(len(context)+1):
+			k = len(context)-start
+			idx = self.find(list(context[start:])+[word])
+			if idx is not None:
+				return backoff+self.logProbs[k][idx]
+			if k>0:
+				idx = self.find(context[start:])
+				if idx is not None:
+					backoff += self.backoffs[k-1][idx]
+		return backoff+self.logProbs[0][1]
+
+	# Natural log-probability of a line and the number of words it was computed over.
+	# With includeUnks=False unknown words are left out of both, as evallm does by default.
+	# Lines that only differ in spacing share a sentenceCache entry, they have the same words.
+	def sentenceLogProb(self, line, includeUnks=True):
+		if self.sentenceCache is None:
+			return self.scoreLine(line, includeUnks)
+		key = (' '.join(line.split()), includeUnks)
+		score = self.sentenceCache.get(key)
+		if score is None:
+			score = self.scoreLine(line, includeUnks)
+			self.sentenceCache.put(key, score)
+		return score
+
+	def scoreLine(self, line, includeUnks=True):
+		return self.scoreIds([0]+self.lineIds(line), includeUnks)
+
+	# sentenceLogProb of a line given as a list of word ids starting with <s>.
+	def scoreIds(self, ids, includeUnks=True):
+		logProb = 0.0
+		words = 0
+		for i in range(1, len(ids)):
+			if ids[i]==1 and not includeUnks:
+				continue
+			logProb += self.logProb(ids[max(0, i-self.order+1):i], ids[i])
+			words += 1
+		return logProb, words
+
+	# Average of the perplexities of the non-empty lines, as lan_model_1.py reports them.
+	def perplexity(self, lines):
+		perplexities=[]
+		for line in lines:
+			logProb, l = self.sentenceLogProb(line)
+			if l!=0:
+				perplexities.append(np.exp(-logProb/l))
+		return np.mean(perplexities)
+
+	# Perplexity of all the lines taken as one text, exp(-total log-probability / total words), as evallm reports it.
+	def corpusPerplexity(self, lines, includeUnks=True):
+		total = 0.0
+		words = 0
+		for line in lines:
+			logProb, l = self.sentenceLogProb(line, includeUnks)
+			total += logProb
+			words += l
+		return np.exp(-total/words)
+
+	# corpusPerplexity of a compiled corpus, scored from its word ids without tokenizing.
+	def compiledPerplexity(self, corpus, includeUnks=True):
+		mapping = corpus.idMap(self.wordIds)
+		total = 0.0
+		words = 0
+		for i in range(len(corpus)):
+			logProb, l = self.scoreIds([0]+mapping[corpus.lineIds(i)].tolist(), includeUnks)
+			total += logProb
+			words += l
+		return np.exp(-total/words)
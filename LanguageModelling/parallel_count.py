@@ -0,0 +1,96 @@
+# Count the n-grams of a file on several processes.
+# The file is cut into byte ranges that end on line boundaries and every worker counts one range with
+# its own vocabulary. The partial counts are then merged in file order with one mergeCounts, which
+# keeps the words in order of first appearance, so the model is identical to the one counted
+# serially by NgramModel.fitFile. The shards are mapped to the merged ids and summed all at once,
+# so the merge costs one sort of all the shard n-grams whatever the number of workers.
+# A compiled corpus (corpus.py) is cut into ranges of lines of about the same number of tokens instead,
+# counted from its ids as NgramModel.fitCorpus counts it.
+#
+# Usage: python parallel_count.py train.txt|train.corpus model.bin [order] [workers]
+
+# Code
+import io
+import os
+import sys
+import multiprocessing
+import numpy as np
+from ngram_model import NgramModel, countArrays, mergeCounts
+from corpus import Corpus, isCompiled
+
+# Byte ranges (start, end) of about the same size, each ending just after a newline.
+def shardRanges(filename, shards):
+	size = os.path.getsize(filename)
+	ranges = []
+	start = 0
+	with open(filename, 'rb') as f:
+		for i in range(1, shards+1):
+			end = size*i//shards
+			if end<size:
+				f.seek(end)
+				f.readline()
+				end = f.tell()
+			if end>start:
+				ranges.append((start, end))
+				start = end
+	return ranges
+
+# Lines of a byte range of the file, read as open() reads the whole file in NgramModel.fitFile: on
+# Python 3 decoded with the locale encoding and with universal newlines, on Python 2 as bytes cut at
+# "\n". The ranges end just after a "\n", so no line or character is cut in two.
+def readLines(filename, start, end):
+	with open(filename, 'rb') as f:
+		f.seek(start)
+		data = f.read(end-start)
+	if isinstance(data, str):
+		return data.split('\n')
+	return list(io.TextIOWrapper(io.BytesIO(data)))
+
+# Line ranges (start, end) of a compiled corpus, each with about the same number of tokens.
+def corpusShardRanges(corpus, shards):
+	offsets = np.asarray(corpus.offsets)
+	cuts = np.searchsorted(offsets, offsets[-1]*np.arange(1, shards)//shards).tolist()
+	bounds = sorted(set([0]+cuts+[len(corpus)]))
+	return [(bounds[i], bounds[i+1]) for i in range(len(bounds)-1)]
+
+# Counts (vocab, lines, grams, counts) of one byte range, or of one line range of a compiled corpus.
+def countShard(task):
+	filename, start, end, order, vocabulary = task
+	model = NgramModel(order, vocabulary)
+	if isCompiled(filename):
+		tables = model.countCorpus(Corpus(filename), None, start, end)
+	else:
+		tables = model.countLines(readLines(filename, start, end))
+	grams, counts = countArrays(tables)
+	return model.vocab, model.lines, grams, counts
+
+def countFileParallel(filename, order=3, vocabulary=None, workers=None):
+	workers = workers or multiprocessing.cpu_count()
+	if isCompiled(filename):
+		ranges = corpusShardRanges(Corpus(filename), workers)
+	else:
+		ranges = shardRanges(filename, workers)
+	tasks = [(filename, start, end, order, vocabulary) for start, end in ranges]
+	pool = multiprocessing.Pool(workers)
+	try:
+		parts = pool.map(countShard, tasks)
+	finally:
+		pool.close()
+		pool.join()
+	return mergeCounts(parts)
+
+# Train model (an empty NgramModel, with its order and vocabulary) on a file counted in parallel.
+def fitParallel(model, filename, workers=None):
+	vocabulary = model.vocab[2:] if model.closed else None
+	vocab, lines, grams, counts = countFileParallel(filename, model.order, vocabulary, workers)
+	model.vocab = vocab
+	model.wordIds = dict((vocab[i], i) for i in range(len(vocab)))
+	model.lines = lines
+	model.build(grams, counts)
+	return model
+
+if __name__=='__main__':
+	from model_io import saveModel
+	order = int(sys.argv[3]) if len(sys.argv)>3 else 3
+	workers = int(sys.argv[4]) if len(sys.argv)>4 else None
+	saveModel(fitParallel(NgramModel(order), sys.argv[1], workers), sys.argv[2])
@@ -0,0 +1,104 @@
+# Minimal perfect hash over a fixed set of integer keys (CHD, "hash, displace and compress"), for
+# n-gram tables that no longer change once training is done.
+# The n keys go to r = n/BUCKET_SIZE buckets by a first hash. Buckets are then placed from the largest:
+# a bucket of several keys tries displacements d = 1, 2, ... until every key lands on a free slot
+# of mix(h1+d) % n, and the buckets of one key take the free slots left directly (stored as -slot-1).
+# A lookup is then one bucket read and one slot read, for every query key at once with NumPy.
+# The slot of a key holds its value and a fingerprint of FINGERPRINT_BITS bits from another hash,
+# so a key that was not in the set is rejected, except with probability 2**-FINGERPRINT_BITS.
+# Memory: 4 bytes of displacement per bucket (2 per key) plus the fingerprint and value of every slot.
+# Small buckets keep the search short: about one key in seven is alone in its bucket and takes one
+# of the last free slots directly, so the buckets of two keys never have to fit into a full table.
+
+# Code
+import numpy as np
+from hashing import mix, mixInt, MASK
+
+BUCKET_SIZE=2		# Average number of keys per bucket
+FINGERPRINT_BITS=16
+MAX_DISPLACEMENT=1<<20	# Tries before giving up on a bucket and starting again with another seed
+SLOT_SALT=0x632be59bd9b4e019
+FINGERPRINT_SALT=0x8cb92ba72f3d8dd7
+
+class PerfectHash(object):
+
+	# keys: distinct non-negative integers, values: their values in the same order.
+	def __init__(self, keys, values, seed=1):
+		keys = np.asarray(keys).astype(np.uint64)
+		values = np.asarray(values)
+		while True:
+			try:
+				self.build(keys, values, seed)
+				return
+			except ValueError:
+				seed+=1
+
+	# Hash, slot hash and fingerprint of every key.
+	def hashes(self, keys):
+		with np.errstate(over='ignore'):
+			h = mix(keys^np.uint64(self.seed))
+			return h, mix(h^np.uint64(SLOT_SALT)), mix(h^np.uint64(FINGERPRINT_SALT))&np.uint64((1<<FINGERPRINT_BITS)-1)
+
+	def build(self, keys, values, seed):
+		self.seed = seed
+		n = len(keys)
+		self.size = n
+		self.buckets = max(1, n//BUCKET_SIZE)
+		h, h1, fingerprint = self.hashes(keys)
+		bucket = (h%np.uint64(self.buckets)).astype(np.int64)
+		order = np.argsort(bucket, kind='mergesort')
+		sizes = np.bincount(bucket, minlength=self.buckets)
+		ends = np.cumsum(sizes)
+		self.displacements = np.zeros(self.buckets, dtype=np.int32)
+		slotOf = np.zeros(n, dtype=np.int64)
+		free = bytearray(b'\1')*n
+		h1 = h1.tolist()
+		for b in np.argsort(-sizes, kind='mergesort').tolist():
+			size = int(sizes[b])
+			if size<2:
+				break
+			members = order[ends[b]-size:ends[b]].tolist()
+			d = 0
+			while True:
+				d+=1
+				if d==MAX_DISPLACEMENT:
+					raise ValueError("No displacement places bucket %d" % b)
+				slots = [mixInt((h1[k]+d)&MASK)%n for k in members]
+				if len(set(slots))==size and all(free[slot] for slot in slots):
+					break
+			for k, slot in zip(members, slots):
+				free[slot] = 0
+				slotOf[k] = slot
+			self.displacements[b] = d
+		# Buckets of one key take the free slots in order.
+		singles = np.flatnonzero(sizes==1)
+		slots = np.flatnonzero(np.frombuffer(bytes(free), dtype=np.uint8))
+		slotOf[order[ends[singles]-1]] = slots
+		self.displacements[singles] = -slots-1
+		self.fingerprints = np.zeros(n, dtype=np.uint16 if FINGERPRINT_BITS<=16 else np.uint32)
+		self.fingerprints[slotOf] = fingerprint
+		self.values = np.zeros(n, dtype=values.dtype)
+		self.values[slotOf] = values
+
+	def __len__(self):
+		return self.size
+
+	def nbytes(self):
+		return self.displacements.nbytes+self.fingerprints.nbytes+self.values.nbytes
+
+	# Slot of every query key and whether the key is in the set (up to fingerprint collisions).
+	def slots(self, keys):
+		keys = np.asarray(keys).astype(np.uint64)
+		h, h1, fingerprint = self.hashes(keys)
+		d = self.displacements[(h%np.uint64(self.buckets)).astype(np.int64)].astype(np.int64)
+		with np.errstate(over='ignore'):
+			displaced = (mix(h1+np.maximum(d, 0).astype(np.uint64))%np.uint64(self.size)).astype(np.int64)
+		slots = np.where(d<0, -d-1, displaced)
+		return slots, self.fingerprints[slots]==fingerprint
+
+	# Value of every query key, default for the keys that are not in the set.
+	def lookup(self, keys, default=0):
+		if self.size==0:
+			return np.full(len(keys), default, dtype=self.values.dtype)
+		slots, found = self.slots(keys)
+		return np.where(found, self.values[slots], default)
@@ -0,0 +1,212 @@
+# Approximate n-gram model in bounded memory, for exploratory runs over very large corpora.
+# Unigram counts are exact. The counts of the higher order n-grams (and of their contexts) go in one
+# count-min sketch with conservative update, whose size is set by a memory budget:
+#   depth = ceil(ln(1/delta)) rows, width = budget / (4 bytes * depth) counters per row.
+# Every count is then over-estimated by at most e/width * (total n-grams added), with probability
+# 1-delta, and never under-estimated. errorBound() gives that bound to report next to a perplexity.
+#
+# Probabilities interpolate the maximum likelihood estimates of every order (Jelinek-Mercer):
+#   P(w | h) = weight * c(h w)/c(h) + (1-weight) * P(w | h without its first word)
+# down to the unigram, which is interpolated with the uniform distribution.
+# The scoring methods are the same as in NgramModel. fitFile also takes a compiled corpus (corpus.py),
+# whose batches of lines go to the sketch as id arrays without going back to words.
+#
+# Usage: python sketch_model.py train.txt|train.corpus test.txt [order] [memory budget in MB]
+
+# Code
+import sys
+import math
+import numpy as np
+from tokenizer import wordpunct_tokenize
+from ngram_model import START, UNK
+from corpus import Corpus, isCompiled
+from hashing import mix
+
+PRIME=np.uint64(0x100000001b3)	# Multiplier that combines the word ids of an n-gram into one key
+CONTEXT=np.uint64(100)		# Added to the order for the keys of contexts
+BATCH=1000			# Lines counted at once
+
+# Keys of the k-word windows of the id array that do not cross a line (line[i] is the line of position i),
+# made of their first length words (all k of them by default).
+def ngramKeys(ids, line, k, salt, length=None):
+	n = len(ids)-k+1
+	if n<=0:
+		return np.zeros(0, dtype=np.uint64)
+	keys = np.full(n, salt, dtype=np.uint64)
+	with np.errstate(over='ignore'):
+		for j in range(length or k):
+			keys = keys*PRIME+ids[j:j+n]
+	return keys[line[:n]==line[k-1:]]
+
+class CountMinSketch(object):
+
+	def __init__(self, width, depth):
+		self.width = width
+		self.depth = depth
+		self.table = np.zeros((depth, width), dtype=np.uint32)
+		self.seeds = np.arange(1, depth+1, dtype=np.uint64)*np.uint64(0x9e3779b97f4a7c15)
+		self.rows = np.arange(depth)[:, None]
+		self.total = 0		# Sum of all the counts added
+
+	# Column of every key in every row, shape (depth, number of keys).
+	def columns(self, keys):
+		with np.errstate(over='ignore'):
+			return np.array([mix(keys^seed)%np.uint64(self.width) for seed in self.seeds]).astype(np.int64)
+
+	# Conservative update: a counter is only raised as far as the key's new estimate needs.
+	def add(self, keys):
+		if len(keys)==0:
+			return
+		keys, counts = np.unique(keys, return_counts=True)
+		columns = self.columns(keys)
+		target = self.table[self.rows, columns].min(axis=0)+counts
+		rows = np.broadcast_to(self.rows, columns.shape)
+		np.maximum.at(self.table, (rows, columns), np.broadcast_to(target, columns.shape).astype(np.uint32))
+		self.total += int(counts.sum())
+
+	def estimate(self, keys):
+		if len(keys)==0:
+			return np.zeros(0, dtype=np.int64)
+		return self.table[self.rows, self.columns(keys)].min(axis=0).astype(np.int64)
+
+class SketchModel(object):
+
+	def __init__(self, order=3, memoryBudget=64*1024*1024, delta=0.01, weight=0.7):
+		self.order = order
+		self.weight = weight
+		self.wordIds = {START: 0, UNK: 1}
+		self.vocab = [START, UNK]
+		self.unigrams = np.zeros(2, dtype=np.int64)	# Exact count of every word id
+		self.lines = 0
+		depth = int(math.ceil(math.log(1/delta)))
+		self.sketch = CountMinSketch(max(1, memoryBudget//(4*depth)), depth)
+
+	def lineIds(self, line):
+		return [self.wordIds.get(word, 1) for word in wordpunct_tokenize(line)]
+
+	# Word ids of the lines, each one starting with <s>, and the line of every position.
+	def batchArrays(self, lines, add):
+		ids = []
+		line = []
+		for listOfWords in lines:
+			if len(listOfWords)==0:
+				continue
+			if add:
+				self.lines+=1
+			ids.append(0)
+			line.append(self.lines)
+			for word in listOfWords:
+				if add and word not in self.wordIds:
+					self.wordIds[word] = len(self.vocab)
+					self.vocab.append(word)
+				ids.append(self.wordIds.get(word, 1))
+				line.append(self.lines)
+		return np.array(ids, dtype=np.uint64), np.array(line, dtype=np.int64)
+
+	def countBatch(self, batch):
+		self.addArrays(*self.batchArrays([wordpunct_tokenize(text) for text in batch], True))
+
+	# Add the word ids of lines (each one starting with <s>) and the line of every position.
+	def addArrays(self, ids, line):
+		counts = np.bincount(ids.astype(np.int64), minlength=len(self.vocab))
+		self.unigrams = np.concatenate((self.unigrams, np.zeros(len(self.vocab)-len(self.unigrams), dtype=np.int64)))+counts
+		for k in range(2, self.order+1):
+			self.sketch.add(ngramKeys(ids, line, k, np.uint64(k)))
+			# The context of every k-gram, to normalize by the count of contexts that were continued.
+			self.sketch.add(ngramKeys(ids, line, k, np.uint64(k)+CONTEXT, k-1))
+
+	def fit(self, lines):
+		batch = []
+		for line in lines:
+			batch.append(line)
+			if len(batch)==BATCH:
+				self.countBatch(batch)
+				batch = []
+		if batch:
+			self.countBatch(batch)
+		return self
+
+	def fitFile(self, filename):
+		if isCompiled(filename):
+			return self.fitCorpus(Corpus(filename))
+		with open(filename) as file:
+			return self.fit(file)
+
+	# fit on a compiled corpus. Its words get ids once, and every batch of lines is one gather through
+	# that mapping, with <s> put before every non-empty line.
+	def fitCorpus(self, corpus):
+		for word in corpus.vocab:
+			if word not in self.wordIds:
+				self.wordIds[word] = len(self.vocab)
+				self.vocab.append(word)
+		mapping = corpus.idMap(self.wordIds).astype(np.uint64)
+		offsets = np.asarray(corpus.offsets)
+		for start in range(0, len(corpus), BATCH):
+			end = min(start+BATCH, len(corpus))
+			lengths = np.diff(offsets[start:end+1])
+			lengths = lengths[lengths!=0]+1
+			starts = np.cumsum(lengths)-lengths
+			ids = np.zeros(lengths.sum(), dtype=np.uint64)
+			words = np.ones(len(ids), dtype=bool)
+			words[starts] = False
+			ids[words] = mapping[corpus.ids[offsets[start]:offsets[end]]]
+			line = np.repeat(self.lines+1+np.arange(len(lengths)), lengths)
+			self.lines += len(lengths)
+			self.addArrays(ids, line)
+		return self
+
+	# Largest over-estimate of any count and the probability that it is exceeded.
+	def errorBound(self):
+		return math.e/self.sketch.width*self.sketch.total, math.exp(-self.sketch.depth)
+
+	# Natural log P of every word of ids (ids[0] being <s>) given the words before it in ids.
+	def positionLogProbs(self, ids):
+		ids = np.array(ids, dtype=np.uint64)
+		line = np.zeros(len(ids), dtype=np.int64)
+		words = ids[1:].astype(np.int64)
+		tokens = float(self.unigrams[1:].sum())
+		probs = self.weight*self.unigrams[words]/tokens+(1-self.weight)/(len(self.vocab)-1)
+		for k in range(2, self.order+1):
+			# k-grams ending at positions k-1 and later, contexts are their first k-1 words.
+			num = self.sketch.estimate(ngramKeys(ids, line, k, np.uint64(k)))
+			den = self.sketch.estimate(ngramKeys(ids, line, k, np.uint64(k)+CONTEXT, k-1))
+			seen = den>0
+			tail = probs[k-2:]
+			tail[seen] = self.weight*np.minimum(num[seen], den[seen])/den[seen].astype(np.float64)+(1-self.weight)*tail[seen]
+		return np.log(probs)
+
+	def logProb(self, context, word):
+		return self.positionLogProbs([0]+list(context)+[word])[-1]
+
+	def sentenceLogProb(self, line, includeUnks=True):
+		ids = [0]+self.lineIds(line)
+		logProbs = self.positionLogProbs(ids)
+		if not includeUnks:
+			logProbs = logProbs[np.array(ids[1:])!=1]
+		return float(logProbs.sum()), len(logProbs)
+
+	def perplexity(self, lines):
+		perplexities=[]
+		for line in lines:
+			logProb, l = self.sentenceLogProb(line)
+			if l!=0:
+				perplexities.append(np.exp(-logProb/l))
+		return np.mean(perplexities)
+
+	def corpusPerplexity(self, lines, includeUnks=True):
+		total = 0.0
+		words = 0
+		for line in lines:
+			logProb, l = self.sentenceLogProb(line, includeUnks)
+			total += logProb
+			words += l
+		return np.exp(-total/words)
+
+if __name__=='__main__':
+	order = int(sys.argv[3]) if len(sys.argv)>3 else 3
+	budget = int(sys.argv[4])*1024*1024 if len(sys.argv)>4 else 64*1024*1024
+	model = SketchModel(order, budget).fitFile(sys.argv[1])
+	with open(sys.argv[2]) as f:
+		perplexity = model.perplexity(f)
+	error, delta = model.errorBound()
+	print("Perplexity = %.2f (counts over-estimated by at most %.1f with probability %.4f)" % (perplexity, error, 1-delta))
@@ -0,0 +1,63 @@
+# Word/punctuation tokenizer giving the same tokens as nltk's wordpunct_tokenize, without importing nltk.
+# nltk's WordPunctTokenizer is a RegexpTokenizer with the pattern \w+|[^\w\s]+ and the flags
+# UNICODE|MULTILINE|DOTALL, applied with findall. The same pattern is compiled once here.
+# tokenizeLines tokenizes a whole file buffer in one finditer pass and cuts the tokens into lines
+# at the newlines (a token never contains one, newlines are \s).
+#
+# Usage: python tokenizer.py file.txt	(checks that every line of file.txt gets nltk's tokens)
+
+# Code
+import re
+import sys
+import time
+
+WORDPUNCT = re.compile(r'\w+|[^\w\s]+', re.UNICODE|re.MULTILINE|re.DOTALL)
+
+def wordpunct_tokenize(text):
+	return WORDPUNCT.findall(text)
+
+# Token lists of the lines of text, one per line as iterating over the file gives them.
+def tokenizeLines(text):
+	if len(text)==0:
+		return []
+	lines = [[]]
+	tokens = lines[-1]
+	newline = text.find('\n')
+	for match in WORDPUNCT.finditer(text):
+		while newline!=-1 and match.start()>newline:
+			tokens = []
+			lines.append(tokens)
+			newline = text.find('\n', newline+1)
+		tokens.append(match.group())
+	while newline!=-1:
+		lines.append([])
+		newline = text.find('\n', newline+1)
+	if text.endswith('\n'):
+		lines.pop()
+	return lines
+
+def tokenizeFile(filename):
+	with open(filename) as f:
+		return tokenizeLines(f.read())
+
+# Lines of the file whose tokens differ from nltk's, and the time taken by both tokenizers.
+def checkConformance(filename):
+	start = time.time()
+	from nltk.tokenize import wordpunct_tokenize as nltkTokenize
+	with open(filename) as f:
+		expected = [nltkTokenize(line) for line in f]
+	nltkTime = time.time()-start
+	start = time.time()
+	lines = tokenizeFile(filename)
+	ownTime = time.time()-start
+	if len(lines)!=len(expected):
+		raise ValueError("%d lines tokenized, nltk gives %d" % (len(lines), len(expected)))
+	mismatches = [i for i in range(len(lines)) if lines[i]!=expected[i]]
+	return mismatches, nltkTime, ownTime
+
+if __name__=='__main__':
+	mismatches, nltkTime, ownTime = checkConformance(sys.argv[1])
+	print("%d lines differ from nltk (nltk import and tokenizing %.2fs, tokenizeFile %.2fs)" % (len(mismatches), nltkTime, ownTime))
+	for i in mismatches[:10]:
+		print("line %d" % (i+1))
+	sys.exit(1 if mismatches else 0)
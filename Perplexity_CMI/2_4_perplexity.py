@@ -0,0 +1,100 @@
+# Find the perplexity of every chunk in "Chunks" with a trigram model trained on "codemix_train.txt".
+# Does in one process what Commands_Readme does with the CMUToolkit binaries:
+#   text2wfreq | wfreq2vocab -top 20000		-> wordFrequencies, topWords
+#   text2idngram | idngram2lm			-> NgramModel (backoff trigram model, kept in memory)
+#   evallm "perplexity -text Chunks/x.txt"	-> corpusPerplexity, for all the chunks (unknown words excluded, as evallm does)
+# The model uses Kneser-Ney smoothing where idngram2lm uses Good-Turing, and wordpunct tokens
+# where the toolkit splits on spaces, so the numbers are close to but not the same as "Observation".
+# The training file and the chunks can also be compiled corpora (LanguageModelling/corpus.py), e.g.
+#   python ../LanguageModelling/corpus.py Chunks/0_10.txt	-> Chunks/0_10.corpus, used in place of 0_10.txt
+# With -quantize 8 or 16 the model is also saved with quantized log-probabilities and backoff weights
+# (LanguageModelling/model_io.py) and loaded back, and the table compares both models on every chunk.
+# The quantized file leaves out the counts, as a deployed model would, so the sizes are given for the
+# full model with and without its counts, and for the quantized one: the two savings separately.
+# Usage: python 2_4_perplexity.py codemix_train.txt Chunks [-quantize 8|16]
+
+import os
+import sys
+import glob
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LanguageModelling'))
+from ngram_model import NgramModel, wordFrequencies, topWords
+from corpus import Corpus, isCompiled
+from model_io import saveBinary, loadBinary
+
+top = 20000	# Vocabulary size, as in wfreq2vocab -top 20000
+order = 3
+
+def trainModel(filename):
+	if isCompiled(filename):
+		corpus = Corpus(filename)
+		return NgramModel(order, topWords(corpus.frequencies(), top)).fitCorpus(corpus)
+	with open(filename) as f:
+		lines = f.readlines()
+	vocabulary = topWords(wordFrequencies(lines), top)
+	return NgramModel(order, vocabulary).fit(lines)
+
+# Chunk files in the order of their CMI range ("0_10.txt", "10_20.txt", ...),
+# each one replaced by its compiled corpus ("0_10.corpus") when there is one.
+def chunkFiles(folder):
+	files = []
+	for filename in glob.glob(os.path.join(folder, '*.txt')):
+		compiled = filename[:-4]+'.corpus'
+		files.append(compiled if isCompiled(compiled) else filename)
+	return sorted(files, key=lambda f: int(os.path.basename(f).split('_')[0]))
+
+def findPerplexities(model, folder):
+	perplexities = []
+	for filename in chunkFiles(folder):
+		if isCompiled(filename):
+			perplexity = model.compiledPerplexity(Corpus(filename), includeUnks=False)
+		else:
+			with open(filename) as f:
+				perplexity = model.corpusPerplexity(f, includeUnks=False)
+		perplexities.append((os.path.splitext(os.path.basename(filename))[0], perplexity))
+	return perplexities
+
+# The model saved with bits-bit quantized values and loaded back, and the sizes of the full file,
+# the full file without counts and the quantized file (without counts).
+def quantizedModel(model, bits):
+	paths = []
+	try:
+		for _ in range(3):
+			fd, path = tempfile.mkstemp(suffix='.bin')
+			os.close(fd)
+			paths.append(path)
+		full, withoutCounts, quantized = paths
+		saveBinary(model, full)
+		saveBinary(model, withoutCounts, counts=False)
+		saveBinary(model, quantized, bits, counts=False)
+		return loadBinary(quantized), tuple(os.path.getsize(path) for path in paths)
+	finally:
+		# The loaded model keeps its memory map open, so removing the file is safe.
+		for path in paths:
+			os.remove(path)
+
+args = sys.argv[1:]
+bits = None
+if '-quantize' in args:
+	bits = int(args.pop(args.index('-quantize')+1))
+	args.remove('-quantize')
+trainFile = args[0]
+chunksFolder = args[1]
+model = trainModel(trainFile)
+if bits is None:
+	print("##############################################")
+	print("#    CMI range       #     Perplexity        #")
+	print("##############################################")
+	for name, perplexity in findPerplexities(model, chunksFolder):
+		print("#      %-14s#     %-18.2f#" % (name.replace('_', '-'), perplexity))
+	print("##############################################")
+else:
+	quantized, sizes = quantizedModel(model, bits)
+	print("####################################################################")
+	print("#    CMI range       #  Perplexity  #  %2d-bit values  #    Delta    #" % bits)
+	print("####################################################################")
+	for (name, perplexity), (name, perplexityQ) in zip(findPerplexities(model, chunksFolder), findPerplexities(quantized, chunksFolder)):
+		print("#      %-14s#  %-12.2f#  %-15.2f#  %+8.3f%%  #" % (name.replace('_', '-'), perplexity, perplexityQ, 100*(perplexityQ/perplexity-1)))
+	print("####################################################################")
+	print("Model file: %.2f MB, %.2f MB without counts, %.2f MB without counts and with %d-bit values" % (
+		sizes[0]/1048576.0, sizes[1]/1048576.0, sizes[2]/1048576.0, bits))